@@ -14,6 +14,7 @@ from sam2.modeling.sam.mask_decoder import MaskDecoder
 from sam2.modeling.sam.prompt_encoder import PromptEncoder
 from sam2.modeling.sam.transformer import TwoWayTransformer
 from sam2.modeling.sam2_utils import get_1d_sine_pe, MLP, select_closest_cond_frames
+from sam2.utils.pinned_memory import gather_to_device
 
 # a large negative value as a placeholder score for missing objects
 NO_OBJ_SCORE = -1024.0
@@ -512,8 +513,55 @@ class SAM2Base(torch.nn.Module):
             pix_feat = current_vision_feats[-1].permute(1, 2, 0).view(B, C, H, W)
             return pix_feat
 
-        num_obj_ptr_tokens = 0
+        if is_init_cond_frame and self.directly_add_no_mem_embed:
+            # for initial conditioning frames, encode them without using any previous memory
+            # directly add no-mem embedding (instead of using the transformer encoder)
+            pix_feat_with_mem = current_vision_feats[-1] + self.no_mem_embed
+            pix_feat_with_mem = pix_feat_with_mem.permute(1, 2, 0).view(B, C, H, W)
+            return pix_feat_with_mem
+
         # Step 1: condition the visual features of the current frame on previous memories
+        memory, memory_pos_embed, num_obj_ptr_tokens = self._gather_memory(
+            frame_idx=frame_idx,
+            is_init_cond_frame=is_init_cond_frame,
+            batch_size=B,
+            device=device,
+            output_dict=output_dict,
+            num_frames=num_frames,
+            track_in_reverse=track_in_reverse,
+        )
+
+        # Step 2: forward the memories through the transformer encoder
+        pix_feat_with_mem = self.memory_attention(
+            curr=current_vision_feats,
+            curr_pos=current_vision_pos_embeds,
+            memory=memory,
+            memory_pos=memory_pos_embed,
+            num_obj_ptr_tokens=num_obj_ptr_tokens,
+        )
+        # reshape the output (HW)BC => BCHW
+        pix_feat_with_mem = pix_feat_with_mem.permute(1, 2, 0).view(B, C, H, W)
+        return pix_feat_with_mem
+
+    def _gather_memory(
+        self,
+        frame_idx,
+        is_init_cond_frame,
+        batch_size,
+        device,
+        output_dict,
+        num_frames,
+        track_in_reverse=False,
+    ):
+        """
+        Gather the memory tokens (from previous frames' memory features and object
+        pointers) that the current frame attends to in the memory attention. It returns
+        the memory and its positional encoding (both in [L, B, mem_dim] shape) and the
+        number of object pointer tokens among them.
+        """
+        B = batch_size
+        C = self.hidden_dim
+        num_obj_ptr_tokens = 0
         if not is_init_cond_frame:
             # Retrieve the memories encoded with the maskmem backbone
             to_cat_memory, to_cat_memory_pos_embed = [], []
@@ -562,12 +610,15 @@ class SAM2Base(torch.nn.Module):
                     out = unselected_cond_outputs.get(prev_frame_idx, None)
                 t_pos_and_prevs.append((t_pos, out))
 
-            for t_pos, prev in t_pos_and_prevs:
-                if prev is None:
-                    continue  # skip padding frames
-                # "maskmem_features" might have been offloaded to CPU in demo use cases,
-                # so we load it back to GPU (it's a no-op if it's already on GPU).
-                feats = prev["maskmem_features"].to(device, non_blocking=True)
+            # skip padding frames
+            t_pos_and_prevs = [(t, p) for t, p in t_pos_and_prevs if p is not None]
+            # "maskmem_features" might have been offloaded to CPU in demo use cases,
+            # so we load them back to GPU all together (it's a no-op if they're already
+            # on GPU), and they might also have been quantized for storage.
+            all_feats = gather_to_device(
+                [prev["maskmem_features"] for _, prev in t_pos_and_prevs], device
+            )
+            for (t_pos, prev), feats in zip(t_pos_and_prevs, all_feats):
                 to_cat_memory.append(feats.flatten(2).permute(2, 0, 1))
                 # Spatial positional encoding (it might have been offloaded to CPU in eval)
                 maskmem_enc = prev["maskmem_pos_enc"][-1].to(device)
@@ -580,7 +631,9 @@ class SAM2Base(torch.nn.Module):
 
             # Construct the list of past object pointers
             if self.use_obj_ptrs_in_encoder:
-                max_obj_ptrs_in_encoder = min(num_frames, self.max_obj_ptrs_in_encoder)
+                max_obj_ptrs_in_encoder = self.max_obj_ptrs_in_encoder
+                if num_frames is not None:  # `num_frames` is unknown in a live stream
+                    max_obj_ptrs_in_encoder = min(num_frames, max_obj_ptrs_in_encoder)
                 # First add those object pointers from selected conditioning frames
                 # (optionally, only include object pointers in the past during evaluation)
                 if not self.training and self.only_obj_ptrs_in_the_past_for_eval:
@@ -632,34 +685,14 @@ class SAM2Base(torch.nn.Module):
                     to_cat_memory.append(obj_ptrs)
                     to_cat_memory_pos_embed.append(obj_pos)
                     num_obj_ptr_tokens = obj_ptrs.shape[0]
-                else:
-                    num_obj_ptr_tokens = 0
         else:
-            # for initial conditioning frames, encode them without using any previous memory
-            if self.directly_add_no_mem_embed:
-                # directly add no-mem embedding (instead of using the transformer encoder)
-                pix_feat_with_mem = current_vision_feats[-1] + self.no_mem_embed
-                pix_feat_with_mem = pix_feat_with_mem.permute(1, 2, 0).view(B, C, H, W)
-                return pix_feat_with_mem
-
             # Use a dummy token on the first frame (to avoid empty memory input to tranformer encoder)
             to_cat_memory = [self.no_mem_embed.expand(1, B, self.mem_dim)]
             to_cat_memory_pos_embed = [self.no_mem_pos_enc.expand(1, B, self.mem_dim)]
 
-        # Step 2: Concatenate the memories and forward through the transformer encoder
         memory = torch.cat(to_cat_memory, dim=0)
         memory_pos_embed = torch.cat(to_cat_memory_pos_embed, dim=0)
-
-        pix_feat_with_mem = self.memory_attention(
-            curr=current_vision_feats,
-            curr_pos=current_vision_pos_embeds,
-            memory=memory,
-            memory_pos=memory_pos_embed,
-            num_obj_ptr_tokens=num_obj_ptr_tokens,
-        )
-        # reshape the output (HW)BC => BCHW
-        pix_feat_with_mem = pix_feat_with_mem.permute(1, 2, 0).view(B, C, H, W)
-        return pix_feat_with_mem
+        return memory, memory_pos_embed, num_obj_ptr_tokens
 
     def _encode_new_memory(
         self,
@@ -4,15 +4,42 @@
 # This source code is licensed under the license found in the
 # LICENSE file in the root directory of this source tree.
 
+import hashlib
+import itertools
+import json
+import queue
+import threading
 import warnings
 from collections import OrderedDict
 
+import numpy as np
 import torch
 
 from tqdm import tqdm
 
 from sam2.modeling.sam2_base import NO_OBJ_SCORE, SAM2Base
-from sam2.utils.misc import concat_points, fill_holes_in_mask_scores, load_video_frames
+from sam2.utils.amg import mask_to_rle_pytorch
+from sam2.utils.feature_cache import FeatureStore, LRUFeatureCache
+from sam2.utils.misc import (
+    concat_points,
+    fill_holes_in_mask_scores,
+    get_autocast_kwargs,
+    get_video_cache_key,
+    load_video_frames,
+    normalize_uint8_image,
+    ObjectFrameOutputs,
+    pack_tensor,
+    resize_mask_scores_in_roi,
+    SlicedFrameOutputs,
+    StreamingVideoFrames,
+    StridedFrameOutputs,
+    unpack_tensor,
+)
+from sam2.utils.pinned_memory import PinnedMemoryPool
+from sam2.utils.quantization import cat_tensors, dequantize, QuantizedTensor
+
+# the version of the file format in `save_state` and `load_state`
+STATE_FILE_VERSION = 4
 
 
 class SAM2VideoPredictor(SAM2Base):
@@ -28,6 +55,11 @@ class SAM2VideoPredictor(SAM2Base):
         clear_non_cond_mem_around_input=False,
         # whether to also clear non-conditioning memory of the surrounding frames (only effective when `clear_non_cond_mem_around_input` is True).
         clear_non_cond_mem_for_multi_obj=False,
+        # if positive, only resize each object's mask to the video resolution within the
+        # bounding box of its foreground (expanded by this many low-res pixels), which
+        # gives the same binary masks at a lower cost for small objects (and the mask
+        # logits outside the box are set to NO_OBJ_SCORE)
+        roi_upsampling_margin=0,
         **kwargs,
     ):
         super().__init__(**kwargs)
@@ -35,6 +67,10 @@ class SAM2VideoPredictor(SAM2Base):
         self.non_overlap_masks = non_overlap_masks
         self.clear_non_cond_mem_around_input = clear_non_cond_mem_around_input
         self.clear_non_cond_mem_for_multi_obj = clear_non_cond_mem_for_multi_obj
+        self.roi_upsampling_margin = roi_upsampling_margin
+        # a digest of the image encoder weights to key the on-disk feature stores
+        # (computed upon the first use, i.e. after the checkpoint is loaded)
+        self._image_encoder_digest = None
 
     @torch.inference_mode()
     def init_state(
@@ -43,6 +79,18 @@ class SAM2VideoPredictor(SAM2Base):
         offload_video_to_cpu=False,
         offload_state_to_cpu=False,
         async_loading_frames=False,
+        num_loading_workers=0,
+        frame_storage="float32",
+        frame_cache_dir=None,
+        feature_cache_max_bytes=0,
+        feature_cache_dtype=None,
+        offload_feature_cache_to_cpu=False,
+        evict_stale_outputs=False,
+        feature_store_dir=None,
+        feature_store_dtype=torch.bfloat16,
+        maskmem_storage_dtype=torch.bfloat16,
+        pred_masks_storage_dtype=torch.float32,
+        pin_offloaded_state=True,
     ):
         """Initialize an inference state."""
         compute_device = self.device  # device of the model
@@ -52,7 +100,52 @@ class SAM2VideoPredictor(SAM2Base):
             offload_video_to_cpu=offload_video_to_cpu,
             async_loading_frames=async_loading_frames,
             compute_device=compute_device,
+            num_loading_workers=num_loading_workers,
+            frame_storage=frame_storage,
+            frame_cache_dir=frame_cache_dir,
         )
+        inference_state = self._build_inference_state(
+            images=images,
+            video_height=video_height,
+            video_width=video_width,
+            offload_video_to_cpu=offload_video_to_cpu,
+            offload_state_to_cpu=offload_state_to_cpu,
+            feature_cache_max_bytes=feature_cache_max_bytes,
+            feature_cache_dtype=feature_cache_dtype,
+            offload_feature_cache_to_cpu=offload_feature_cache_to_cpu,
+            evict_stale_outputs=evict_stale_outputs,
+            maskmem_storage_dtype=maskmem_storage_dtype,
+            pred_masks_storage_dtype=pred_masks_storage_dtype,
+            pin_offloaded_state=pin_offloaded_state,
+        )
+        if feature_store_dir is not None:
+            inference_state["feature_store"] = FeatureStore(
+                store_dir=feature_store_dir,
+                key=self._get_feature_store_key(video_path),
+                num_frames=inference_state["num_frames"],
+                storage_dtype=feature_store_dtype,
+            )
+        # Warm up the visual backbone and cache the image feature on frame 0
+        self._get_image_feature(inference_state, frame_idx=0, batch_size=1)
+        return inference_state
+
+    def _build_inference_state(
+        self,
+        images,
+        video_height,
+        video_width,
+        offload_video_to_cpu,
+        offload_state_to_cpu,
+        feature_cache_max_bytes,
+        feature_cache_dtype,
+        offload_feature_cache_to_cpu,
+        evict_stale_outputs,
+        maskmem_storage_dtype,
+        pred_masks_storage_dtype,
+        pin_offloaded_state,
+    ):
+        """Build an inference state (without any inputs or outputs) on the frames."""
+        compute_device = self.device  # device of the model
         inference_state = {}
         inference_state["images"] = images
         inference_state["num_frames"] = len(images)
@@ -64,6 +157,31 @@ class SAM2VideoPredictor(SAM2Base):
         # (e.g. in a test case of 768x768 model, fps dropped from 27 to 24 when tracking one object
         # and from 24 to 21 when tracking two objects)
         inference_state["offload_state_to_cpu"] = offload_state_to_cpu
+        # whether to evict the non-conditioning outputs during tracking once they are too
+        # far away from the current frame to be used as memory (turning on this option keeps
+        # the inference state size constant over long videos, but the evicted frames are
+        # no longer available as memory when tracking again through them later)
+        inference_state["evict_stale_outputs"] = evict_stale_outputs
+        # the dtypes to store the memory features (bfloat16 or int8) and the low-res
+        # mask logits (float32, float16 or int8) on each frame in, where int8 quantizes
+        # them (with a scale per object and channel for the memory features, and clamped
+        # into [-32, 32] for the mask logits) to reduce the state size on long videos
+        if maskmem_storage_dtype not in [torch.bfloat16, torch.int8]:
+            raise ValueError(
+                f"Unsupported maskmem storage dtype {maskmem_storage_dtype}"
+            )
+        if pred_masks_storage_dtype not in [torch.float32, torch.float16, torch.int8]:
+            raise ValueError(
+                f"Unsupported pred_masks storage dtype {pred_masks_storage_dtype}"
+            )
+        inference_state["maskmem_storage_dtype"] = maskmem_storage_dtype
+        inference_state["pred_masks_storage_dtype"] = pred_masks_storage_dtype
+        # the image mean and std to normalize the video frames held as uint8 tensors
+        # (with `frame_storage="uint8"` or `"jpeg"`) on the fly before the image encoder
+        img_mean = torch.tensor([0.485, 0.456, 0.406], device=compute_device)
+        img_std = torch.tensor([0.229, 0.224, 0.225], device=compute_device)
+        inference_state["img_mean"] = img_mean[:, None, None]
+        inference_state["img_std"] = img_std[:, None, None]
         # the original video height and width, used for resizing final output scores
         inference_state["video_height"] = video_height
         inference_state["video_width"] = video_width
@@ -72,11 +190,31 @@ class SAM2VideoPredictor(SAM2Base):
             inference_state["storage_device"] = torch.device("cpu")
         else:
             inference_state["storage_device"] = compute_device
+        # a pool of pinned CPU buffers to offload the outputs into (with
+        # `pin_offloaded_state=True`), which makes the copies between GPU and CPU
+        # asynchronous and faster than those into pageable memory
+        use_pinned_memory = pin_offloaded_state and compute_device.type == "cuda"
+        if offload_state_to_cpu and use_pinned_memory:
+            inference_state["pinned_memory_pool"] = PinnedMemoryPool()
+        else:
+            inference_state["pinned_memory_pool"] = None
         # inputs on each frame
         inference_state["point_inputs_per_obj"] = {}
         inference_state["mask_inputs_per_obj"] = {}
         # visual features on a small number of recently visited frames for quick interactions
-        inference_state["cached_features"] = {}
+        # (an LRU cache under a memory budget of `feature_cache_max_bytes`, which always keeps
+        # at least the most recent frame; the cached features can optionally be stored in a
+        # lower precision such as bfloat16 via `feature_cache_dtype` or offloaded to CPU)
+        cache_device = torch.device("cpu") if offload_feature_cache_to_cpu else None
+        inference_state["cached_features"] = LRUFeatureCache(
+            max_bytes=feature_cache_max_bytes,
+            storage_dtype=feature_cache_dtype,
+            storage_device=cache_device,
+        )
+        # an optional persistent on-disk store of the visual features on all frames,
+        # which is shared across sessions on the same video (see `init_state` and
+        # `populate_feature_store`); it's looked up after the feature cache above
+        inference_state["feature_store"] = None
         # values that don't change across frames (so we only need to hold one copy of them)
         inference_state["constants"] = {}
         # mapping between client-side object id and model-side object index
@@ -102,10 +240,155 @@ class SAM2VideoPredictor(SAM2Base):
         # metadata for each tracking frame (e.g. which direction it's tracked)
         inference_state["tracking_has_started"] = False
         inference_state["frames_already_tracked"] = {}
-        # Warm up the visual backbone and cache the image feature on frame 0
-        self._get_image_feature(inference_state, frame_idx=0, batch_size=1)
+        # The objects that got new inputs since they were last propagated, in each
+        # direction ({reverse: set of obj_ids}), which are re-tracked when propagating
+        # with `only_dirty_objects=True`
+        inference_state["dirty_obj_ids"] = {False: set(), True: set()}
+        # The memory features and object pointer of an empty mask on each frame with
+        # inputs in a stream ({frame_idx: (maskmem_features, obj_ptr)}), stored to fill
+        # in the placeholder slots on these frames once their images are dropped
+        inference_state["empty_mask_memory"] = {}
+        # the consolidated masks at the video resolution on the last interacted frame
+        # (see `_get_interactive_video_res_output`)
+        inference_state["interactive_video_res_masks"] = None
         return inference_state
 
+    @torch.inference_mode()
+    def init_stream_state(
+        self,
+        offload_video_to_cpu=False,
+        offload_state_to_cpu=False,
+        max_frames_in_memory=16,
+        feature_cache_max_bytes=0,
+        feature_cache_dtype=None,
+        offload_feature_cache_to_cpu=False,
+        evict_stale_outputs=True,
+        maskmem_storage_dtype=torch.bfloat16,
+        pred_masks_storage_dtype=torch.float32,
+        pin_offloaded_state=True,
+    ):
+        """
+        Initialize an inference state on a live video stream (e.g. a camera feed), which
+        starts with no frames. The frames are then added one at a time via `push_frame`,
+        which also tracks the objects on each new frame.
+
+        Only the most recent `max_frames_in_memory` frames are kept (so prompts can only
+        be added on these frames), and the stale non-conditioning outputs are evicted by
+        default, so that the session has a bounded size over an unbounded stream.
+        """
+        images = StreamingVideoFrames(
+            image_size=self.image_size,
+            offload_video_to_cpu=offload_video_to_cpu,
+            compute_device=self.device,
+            max_frames_in_memory=max_frames_in_memory,
+        )
+        inference_state = self._build_inference_state(
+            images=images,
+            video_height=None,  # filled when the first frame is pushed
+            video_width=None,  # filled when the first frame is pushed
+            offload_video_to_cpu=offload_video_to_cpu,
+            offload_state_to_cpu=offload_state_to_cpu,
+            feature_cache_max_bytes=feature_cache_max_bytes,
+            feature_cache_dtype=feature_cache_dtype,
+            offload_feature_cache_to_cpu=offload_feature_cache_to_cpu,
+            evict_stale_outputs=evict_stale_outputs,
+            maskmem_storage_dtype=maskmem_storage_dtype,
+            pred_masks_storage_dtype=pred_masks_storage_dtype,
+            pin_offloaded_state=pin_offloaded_state,
+        )
+        # the total number of frames is unknown in a stream
+        inference_state["num_frames"] = None
+        return inference_state
+
+    @torch.inference_mode()
+    def push_frame(self, inference_state, frame):
+        """
+        Add a new frame to a streaming inference state (from `init_stream_state`) and
+        track all objects on it using the memory of the previous frames.
+
+        The frame can be an RGB image as a HxWx3 uint8 numpy array or tensor, a PIL
+        image, or the bytes of an encoded image file (e.g. JPEG or PNG). It returns the
+        frame index, the object ids and their mask scores at the original video
+        resolution (which are empty if no object has been added yet). Prompts can then
+        be added on this frame via `add_new_points_or_box` or `add_new_mask`.
+        """
+        images = inference_state["images"]
+        frame_idx = images.append(frame)
+        # only keep track of the tracked frames still in the stream (i.e. those where
+        # prompts can be added), so that the session has a bounded size
+        frames_already_tracked = inference_state["frames_already_tracked"]
+        for t in [t for t in frames_already_tracked if t not in images]:
+            del frames_already_tracked[t]
+        inference_state["video_height"] = images.video_height
+        inference_state["video_width"] = images.video_width
+        obj_ids = inference_state["obj_ids"]
+        batch_size = self._get_obj_num(inference_state)
+        if batch_size == 0:
+            video_res_masks = torch.zeros(
+                0,
+                1,
+                images.video_height,
+                images.video_width,
+                device=inference_state["device"],
+            )
+            return frame_idx, obj_ids, video_res_masks
+
+        # consolidate any prompts added on the previous frames into the memory
+        self.propagate_in_video_preflight(inference_state)
+        # Fill in the placeholder slots of the objects added after the tracking started
+        # on the frames used as memory. The objects whose placeholder slots are on frames
+        # already dropped from the stream are instead tracked on their own memory below.
+        unfilled_obj_inds = self._fill_placeholder_outputs(
+            inference_state, frames_to_track={frame_idx}, start_frame_idx=frame_idx
+        )
+        output_dict = inference_state["output_dict"]
+        storage_key = "non_cond_frame_outputs"
+        current_out, pred_masks = self._run_single_frame_inference(
+            inference_state=inference_state,
+            output_dict=output_dict,
+            frame_idx=frame_idx,
+            batch_size=batch_size,
+            is_init_cond_frame=False,
+            point_inputs=None,
+            mask_inputs=None,
+            reverse=False,
+            run_mem_encoder=True,
+        )
+        output_dict[storage_key][frame_idx] = current_out
+        for obj_idx in sorted(unfilled_obj_inds):
+            obj_out, obj_pred_masks = self._run_single_frame_inference(
+                inference_state=inference_state,
+                output_dict=inference_state["output_dict_per_obj"][obj_idx],
+                frame_idx=frame_idx,
+                batch_size=1,
+                is_init_cond_frame=False,
+                point_inputs=None,
+                mask_inputs=None,
+                reverse=False,
+                run_mem_encoder=True,
+            )
+            self._set_obj_output(inference_state, frame_idx, obj_idx, obj_out)
+            pred_masks[obj_idx : obj_idx + 1] = obj_pred_masks
+        self._add_output_per_object(
+            inference_state, frame_idx, current_out, storage_key
+        )
+        inference_state["frames_already_tracked"][frame_idx] = {"reverse": False}
+        if inference_state["evict_stale_outputs"]:
+            self._evict_stale_outputs(inference_state, frame_idx, reverse=False)
+
+        _, video_res_masks = self._get_orig_video_res_output(
+            inference_state, pred_masks
+        )
+        return frame_idx, obj_ids, video_res_masks
+
+    def propagate_in_stream(self, inference_state, frames):
+        """
+        Push the frames from an iterable (e.g. a generator reading from a camera) into a
+        streaming inference state one at a time, yielding the outputs of `push_frame`.
+        """
+        for frame in frames:
+            yield self.push_frame(inference_state, frame)
+
     @classmethod
     def from_pretrained(cls, model_id: str, **kwargs) -> "SAM2VideoPredictor":
         """
@@ -129,38 +412,228 @@ class SAM2VideoPredictor(SAM2Base):
         if obj_idx is not None:
             return obj_idx
 
-        # This is a new object id not sent to the server before. We only allow adding
-        # new objects *before* the tracking starts.
-        allow_new_object = not inference_state["tracking_has_started"]
-        if allow_new_object:
-            # get the next object slot
-            obj_idx = len(inference_state["obj_id_to_idx"])
-            inference_state["obj_id_to_idx"][obj_id] = obj_idx
-            inference_state["obj_idx_to_id"][obj_idx] = obj_id
-            inference_state["obj_ids"] = list(inference_state["obj_id_to_idx"])
-            # set up input and output structures for this object
-            inference_state["point_inputs_per_obj"][obj_idx] = {}
-            inference_state["mask_inputs_per_obj"][obj_idx] = {}
-            inference_state["output_dict_per_obj"][obj_idx] = {
-                "cond_frame_outputs": {},  # dict containing {frame_idx: <out>}
-                "non_cond_frame_outputs": {},  # dict containing {frame_idx: <out>}
-            }
-            inference_state["temp_output_dict_per_obj"][obj_idx] = {
-                "cond_frame_outputs": {},  # dict containing {frame_idx: <out>}
-                "non_cond_frame_outputs": {},  # dict containing {frame_idx: <out>}
-            }
-            return obj_idx
-        else:
-            raise RuntimeError(
-                f"Cannot add new object id {obj_id} after tracking starts. "
-                f"All existing object ids: {inference_state['obj_ids']}. "
-                f"Please call 'reset_state' to restart from scratch."
+        # This is a new object id not sent to the server before. If it's added after
+        # the tracking starts, we also add a slot for it in the existing outputs (and it
+        # can then be tracked alone via `propagate_in_video` with `obj_ids=[obj_id]`).
+        # get the next object slot
+        obj_idx = len(inference_state["obj_id_to_idx"])
+        inference_state["obj_id_to_idx"][obj_id] = obj_idx
+        inference_state["obj_idx_to_id"][obj_idx] = obj_id
+        inference_state["obj_ids"] = list(inference_state["obj_id_to_idx"])
+        # set up input and output structures for this object
+        inference_state["point_inputs_per_obj"][obj_idx] = {}
+        inference_state["mask_inputs_per_obj"][obj_idx] = {}
+        # (per-object views of the multi-object outputs in "output_dict")
+        output_dict = inference_state["output_dict"]
+        inference_state["output_dict_per_obj"][obj_idx] = {
+            "cond_frame_outputs": ObjectFrameOutputs(output_dict, obj_idx),
+            "non_cond_frame_outputs": ObjectFrameOutputs(output_dict, obj_idx),
+        }
+        inference_state["temp_output_dict_per_obj"][obj_idx] = {
+            "cond_frame_outputs": {},  # dict containing {frame_idx: <out>}
+            "non_cond_frame_outputs": {},  # dict containing {frame_idx: <out>}
+        }
+        if inference_state["tracking_has_started"]:
+            self._add_object_slot_to_outputs(inference_state, obj_idx)
+        return obj_idx
+
+    def _add_object_slot_to_outputs(self, inference_state, obj_idx):
+        """
+        Add a slot for a new object (added after the tracking starts) to the existing
+        multi-object outputs in "output_dict", holding placeholder values (i.e. no mask
+        with NO_OBJ_SCORE, and zero object pointer and memory features). These frames
+        are not added into the new object's "output_dict_per_obj", so its placeholder
+        values are never used as its memory when tracking it alone, while they're filled
+        in via `_fill_placeholder_outputs` before tracking all objects together. (The
+        existing objects' views in "output_dict_per_obj" resolve to the new outputs upon
+        lookup.)
+        """
+        # (the outputs are accessed on CPU below if they're offloaded to CPU)
+        self._sync_offloaded_state(inference_state)
+        output_dict = inference_state["output_dict"]
+        for storage_key in ["cond_frame_outputs", "non_cond_frame_outputs"]:
+            for frame_idx, out in output_dict[storage_key].items():
+                pred_masks = out["pred_masks"]
+                placeholder_masks = pred_masks.new_full(
+                    (1,) + pred_masks.shape[1:], NO_OBJ_SCORE
+                )
+                out["pred_masks"] = cat_tensors([pred_masks, placeholder_masks])
+                obj_ptr = out["obj_ptr"]
+                out["obj_ptr"] = torch.cat([obj_ptr, torch.zeros_like(obj_ptr[:1])])
+                maskmem_features = out["maskmem_features"]
+                if maskmem_features is not None:
+                    placeholder_features = maskmem_features.new_zeros(
+                        (1,) + maskmem_features.shape[1:]
+                    )
+                    out["maskmem_features"] = cat_tensors(
+                        [maskmem_features, placeholder_features]
+                    )
+                    out["maskmem_pos_enc"] = self._expand_maskmem_pos_enc(
+                        inference_state, batch_size=obj_idx + 1
+                    )
+
+    def _fill_placeholder_outputs(
+        self,
+        inference_state,
+        frames_to_track=(),
+        start_frame_idx=None,
+        reverse=False,
+        frame_stride=1,
+    ):
+        """
+        Fill in the placeholder slots of objects in the multi-object outputs in
+        "output_dict" (i.e. on the frames that are not in the object's view in
+        "output_dict_per_obj", see `_add_object_slot_to_outputs` and `_set_obj_output`)
+        with the memory of an empty mask and a dummy object pointer, as for the objects
+        without any outputs on a frame in `_consolidate_temp_output_across_obj`. This is
+        needed before tracking all objects together, where the memory of every object in
+        the multi-object outputs is used. The frames in `frames_to_track` are skipped,
+        as they will be tracked again before being used as memory. If given, only the
+        frames with inputs and the non-conditioning frames within the memory horizon
+        before `start_frame_idx` (in the tracking direction) are filled in, as the
+        other frames are not used as memory when tracking from there.
+
+        It returns the indices of the objects whose placeholder slots couldn't be filled
+        as their frames are no longer available (e.g. dropped from a stream).
+        """
+        output_dict = inference_state["output_dict"]
+        output_dict_per_obj = inference_state["output_dict_per_obj"]
+        frame_inds_with_inputs = inference_state["consolidated_frame_inds"][
+            "non_cond_frame_outputs"
+        ]
+        horizon = self._get_memory_horizon() * frame_stride
+        unfilled_obj_inds = set()
+        for storage_key in ["cond_frame_outputs", "non_cond_frame_outputs"]:
+            for frame_idx, out in output_dict[storage_key].items():
+                if frame_idx in frames_to_track:
+                    continue
+                if (
+                    start_frame_idx is not None
+                    and storage_key == "non_cond_frame_outputs"
+                    and frame_idx not in frame_inds_with_inputs
+                ):
+                    dist = start_frame_idx - frame_idx
+                    if not 0 < (-dist if reverse else dist) <= horizon:
+                        continue
+                obj_inds = [
+                    obj_idx
+                    for obj_idx, obj_output_dict in output_dict_per_obj.items()
+                    if frame_idx not in obj_output_dict["cond_frame_outputs"]
+                    and frame_idx not in obj_output_dict["non_cond_frame_outputs"]
+                ]
+                if len(obj_inds) == 0:
+                    continue
+                empty_mask_memory = self._get_empty_mask_memory(
+                    inference_state,
+                    frame_idx,
+                    run_mem_encoder=out["maskmem_features"] is not None,
+                )
+                if empty_mask_memory is None:
+                    unfilled_obj_inds.update(obj_inds)
+                    continue
+                maskmem_features, empty_mask_ptr = empty_mask_memory
+                # (the outputs are accessed on CPU below if they're offloaded)
+                self._sync_offloaded_state(inference_state)
+                for obj_idx in obj_inds:
+                    obj_slice = slice(obj_idx, obj_idx + 1)
+                    out["obj_ptr"][obj_slice] = empty_mask_ptr
+                    if out["maskmem_features"] is not None:
+                        out["maskmem_features"][obj_slice] = maskmem_features
+                    output_dict_per_obj[obj_idx][storage_key].link(frame_idx)
+        return unfilled_obj_inds
+
+    def _get_empty_mask_memory(self, inference_state, frame_idx, run_mem_encoder=True):
+        """
+        Get the memory features (in the storage format, or `None` if not running the
+        memory encoder) and the dummy object pointer of an empty mask for one object on
+        a frame. It returns `None` if the frame is no longer available and these weren't
+        stored via `_store_empty_mask_memory`.
+        """
+        empty_mask_memory = inference_state["empty_mask_memory"].get(frame_idx)
+        if empty_mask_memory is not None:
+            return empty_mask_memory
+        if not self._is_frame_available(inference_state, frame_idx):
+            return None
+        empty_mask_ptr = self._get_empty_mask_ptr(inference_state, frame_idx)
+        maskmem_features = None
+        if run_mem_encoder:
+            high_res_masks = torch.full(
+                size=(1, 1, self.image_size, self.image_size),
+                fill_value=NO_OBJ_SCORE,
+                dtype=torch.float32,
+                device=inference_state["device"],
+            )
+            maskmem_features, _ = self._run_memory_encoder(
+                inference_state=inference_state,
+                frame_idx=frame_idx,
+                batch_size=1,
+                high_res_masks=high_res_masks,
+                is_mask_from_pts=True,  # as in consolidation
             )
+        return maskmem_features, empty_mask_ptr
+
+    def _store_empty_mask_memory(self, inference_state):
+        """
+        Store the empty-mask memory (see `_get_empty_mask_memory`) on the frames with
+        inputs in a stream while their images are still available, so that the objects
+        added later can be filled in on these frames (which are always used as memory)
+        after they're dropped from the stream.
+        """
+        consolidated_frame_inds = inference_state["consolidated_frame_inds"]
+        frame_inds_with_inputs = (
+            consolidated_frame_inds["cond_frame_outputs"]
+            | consolidated_frame_inds["non_cond_frame_outputs"]
+        )
+        empty_mask_memory = inference_state["empty_mask_memory"]
+        for frame_idx in [
+            t for t in empty_mask_memory if t not in frame_inds_with_inputs
+        ]:
+            del empty_mask_memory[frame_idx]
+        for frame_idx in sorted(frame_inds_with_inputs - empty_mask_memory.keys()):
+            if self._is_frame_available(inference_state, frame_idx):
+                empty_mask_memory[frame_idx] = self._get_empty_mask_memory(
+                    inference_state, frame_idx
+                )
+
+    def _is_frame_available(self, inference_state, frame_idx):
+        """
+        Whether the image features on a frame can be looked up or computed, which is not
+        the case for the frames already dropped from a stream (unless still cached).
+        """
+        images = inference_state["images"]
+        if isinstance(images, StreamingVideoFrames) and frame_idx not in images:
+            return frame_idx in inference_state["cached_features"]
+        return True
+
+    def _is_init_cond_frame(self, inference_state, frame_idx, obj_idx):
+        """
+        Whether the inputs on a frame are initial inputs of an object (i.e. without any
+        memory from other frames), which is the case if the frame hasn't been tracked
+        before, or if the object (added after tracking starts) has no conditioning
+        outputs yet to use as its memory.
+        """
+        if frame_idx not in inference_state["frames_already_tracked"]:
+            return True
+        obj_output_dict = inference_state["output_dict_per_obj"][obj_idx]
+        return len(obj_output_dict["cond_frame_outputs"]) == 0
 
     def _obj_idx_to_id(self, inference_state, obj_idx):
         """Map model-side object index to client-side object id."""
         return inference_state["obj_idx_to_id"][obj_idx]
 
+    def _get_obj_indices(self, inference_state, obj_ids):
+        """Map a list of client-side object ids to model-side object indices."""
+        obj_indices = []
+        for obj_id in obj_ids:
+            obj_idx = inference_state["obj_id_to_idx"].get(obj_id, None)
+            if obj_idx is None:
+                raise RuntimeError(
+                    f"Unknown object id {obj_id}. All existing object ids: "
+                    f"{inference_state['obj_ids']}."
+                )
+            obj_indices.append(obj_idx)
+        return obj_indices
+
     def _get_obj_num(self, inference_state):
         """Get the total number of unique object ids received so far in this session."""
         return len(inference_state["obj_idx_to_id"])
@@ -247,7 +720,9 @@ class SAM2VideoPredictor(SAM2Base):
         # frame, meaning that the inputs points are to generate segments on this frame without
         # using any memory from other frames, like in SAM. Otherwise (if it has been tracked),
         # the input points will be used to correct the already tracked masks.
-        is_init_cond_frame = frame_idx not in inference_state["frames_already_tracked"]
+        is_init_cond_frame = self._is_init_cond_frame(
+            inference_state, frame_idx, obj_idx
+        )
         # whether to track in reverse time order
         if is_init_cond_frame:
             reverse = False
@@ -273,7 +748,9 @@ class SAM2VideoPredictor(SAM2Base):
 
         if prev_out is not None and prev_out["pred_masks"] is not None:
             device = inference_state["device"]
-            prev_sam_mask_logits = prev_out["pred_masks"].to(device, non_blocking=True)
+            prev_sam_mask_logits = dequantize(
+                prev_out["pred_masks"], device, torch.float32, non_blocking=True
+            )
             # Clamp the scale of prev_sam_mask_logits to avoid rare numerical issues.
             prev_sam_mask_logits = torch.clamp(prev_sam_mask_logits, -32.0, 32.0)
         current_out, _ = self._run_single_frame_inference(
@@ -297,15 +774,8 @@ class SAM2VideoPredictor(SAM2Base):
 
         # Resize the output mask to the original video resolution
         obj_ids = inference_state["obj_ids"]
-        consolidated_out = self._consolidate_temp_output_across_obj(
-            inference_state,
-            frame_idx,
-            is_cond=is_cond,
-            run_mem_encoder=False,
-            consolidate_at_video_res=True,
-        )
-        _, video_res_masks = self._get_orig_video_res_output(
-            inference_state, consolidated_out["pred_masks_video_res"]
+        video_res_masks = self._get_interactive_video_res_output(
+            inference_state, frame_idx, obj_idx, is_cond
         )
         return frame_idx, obj_ids, video_res_masks
 
@@ -352,7 +822,9 @@ class SAM2VideoPredictor(SAM2Base):
         # frame, meaning that the inputs points are to generate segments on this frame without
         # using any memory from other frames, like in SAM. Otherwise (if it has been tracked),
         # the input points will be used to correct the already tracked masks.
-        is_init_cond_frame = frame_idx not in inference_state["frames_already_tracked"]
+        is_init_cond_frame = self._is_init_cond_frame(
+            inference_state, frame_idx, obj_idx
+        )
         # whether to track in reverse time order
         if is_init_cond_frame:
             reverse = False
@@ -385,17 +857,64 @@ class SAM2VideoPredictor(SAM2Base):
 
         # Resize the output mask to the original video resolution
         obj_ids = inference_state["obj_ids"]
-        consolidated_out = self._consolidate_temp_output_across_obj(
-            inference_state,
-            frame_idx,
-            is_cond=is_cond,
-            run_mem_encoder=False,
-            consolidate_at_video_res=True,
+        video_res_masks = self._get_interactive_video_res_output(
+            inference_state, frame_idx, obj_idx, is_cond
         )
+        return frame_idx, obj_ids, video_res_masks
+
+    def _get_interactive_video_res_output(
+        self, inference_state, frame_idx, obj_idx, is_cond
+    ):
+        """
+        Get the consolidated masks of all objects at the original video resolution on a
+        frame after the object `obj_idx` received new inputs on it.
+
+        The consolidated masks on the last interacted frame are kept in a persistent
+        buffer, so that a new click only resizes the mask of the clicked object into it
+        (instead of consolidating and resizing all the objects again). The buffer is
+        rebuilt (with a single batched resizing across all objects) when interacting
+        with another frame or object set, and it's dropped whenever the tracking
+        outputs may change (e.g. upon propagation).
+        """
+        device = inference_state["device"]
+        video_H = inference_state["video_height"]
+        video_W = inference_state["video_width"]
+        batch_size = self._get_obj_num(inference_state)
+        buffer = inference_state["interactive_video_res_masks"]
+        if (
+            buffer is None
+            or buffer["frame_idx"] != frame_idx
+            or buffer["is_cond"] != is_cond
+            or buffer["masks"].size(0) != batch_size
+        ):
+            consolidated_out = self._consolidate_temp_output_across_obj(
+                inference_state, frame_idx, is_cond=is_cond, run_mem_encoder=False
+            )
+            masks = torch.nn.functional.interpolate(
+                consolidated_out["pred_masks"].to(device, non_blocking=True),
+                size=(video_H, video_W),
+                mode="bilinear",
+                align_corners=False,
+            )
+            buffer = {"frame_idx": frame_idx, "is_cond": is_cond, "masks": masks}
+            inference_state["interactive_video_res_masks"] = buffer
+        else:
+            storage_key = "cond_frame_outputs" if is_cond else "non_cond_frame_outputs"
+            obj_temp_output_dict = inference_state["temp_output_dict_per_obj"][obj_idx]
+            obj_mask = obj_temp_output_dict[storage_key][frame_idx]["pred_masks"]
+            buffer["masks"][obj_idx : obj_idx + 1] = torch.nn.functional.interpolate(
+                dequantize(obj_mask, device, torch.float32, non_blocking=True),
+                size=(video_H, video_W),
+                mode="bilinear",
+                align_corners=False,
+            )
         _, video_res_masks = self._get_orig_video_res_output(
-            inference_state, consolidated_out["pred_masks_video_res"]
+            inference_state, buffer["masks"]
         )
-        return frame_idx, obj_ids, video_res_masks
+        if video_res_masks is buffer["masks"]:
+            # don't return the buffer itself, as it's updated in place by later clicks
+            video_res_masks = video_res_masks.clone()
+        return video_res_masks
 
     def _get_orig_video_res_output(self, inference_state, any_res_masks):
         """
@@ -405,9 +924,18 @@ class SAM2VideoPredictor(SAM2Base):
         device = inference_state["device"]
         video_H = inference_state["video_height"]
         video_W = inference_state["video_width"]
-        any_res_masks = any_res_masks.to(device, non_blocking=True)
+        any_res_masks = dequantize(
+            any_res_masks, device, torch.float32, non_blocking=True
+        )
         if any_res_masks.shape[-2:] == (video_H, video_W):
             video_res_masks = any_res_masks
+        elif self.roi_upsampling_margin > 0:
+            video_res_masks = resize_mask_scores_in_roi(
+                any_res_masks,
+                size=(video_H, video_W),
+                margin=self.roi_upsampling_margin,
+                fill_value=NO_OBJ_SCORE,
+            )
         else:
             video_res_masks = torch.nn.functional.interpolate(
                 any_res_masks,
@@ -419,6 +947,44 @@ class SAM2VideoPredictor(SAM2Base):
             video_res_masks = self._apply_non_overlapping_constraints(video_res_masks)
         return any_res_masks, video_res_masks
 
+    def _get_output_masks(
+        self, inference_state, pred_masks, output_mode, obj_indices=None
+    ):
+        """
+        Turn the low-res mask scores of all objects (or only those in `obj_indices`, if
+        given) into the output masks in one of the following `output_mode`s:
+        - "video_res_logits": the mask logits at the original video resolution
+        - "low_res_logits": the mask logits at the model's low resolution (that is,
+          `pred_masks` without resizing)
+        - "binary": the boolean masks at the original video resolution
+        - "rle": the uncompressed RLEs of the binary masks (see `mask_to_rle_pytorch`)
+        The masks are thresholded and encoded on the compute device, so only the final
+        output needs to be transferred to CPU by the caller (or only the RLE counts).
+        """
+        if output_mode not in ["video_res_logits", "low_res_logits", "binary", "rle"]:
+            raise ValueError(f"Unknown output_mode {output_mode}")
+        pred_masks = dequantize(
+            pred_masks, inference_state["device"], torch.float32, non_blocking=True
+        )
+        if obj_indices is not None and not self.non_overlap_masks:
+            # only resize the masks of the selected objects (unless we need the other
+            # objects' masks to apply non-overlapping constraints on them)
+            pred_masks = pred_masks[obj_indices]
+            obj_indices = None
+        if output_mode == "low_res_logits":
+            out_masks = pred_masks
+            if self.non_overlap_masks:
+                out_masks = self._apply_non_overlapping_constraints(out_masks)
+        else:
+            _, out_masks = self._get_orig_video_res_output(inference_state, pred_masks)
+        if obj_indices is not None:
+            out_masks = out_masks[obj_indices]
+        if output_mode in ["binary", "rle"]:
+            out_masks = out_masks > 0.0
+        if output_mode == "rle":
+            out_masks = mask_to_rle_pytorch(out_masks[:, 0])
+        return out_masks
+
     def _consolidate_temp_output_across_obj(
         self,
         inference_state,
@@ -436,6 +1002,8 @@ class SAM2VideoPredictor(SAM2Base):
         2) if specified, rerun memory encoder after apply non-overlapping constraints
            on the object scores.
         """
+        # (the outputs are accessed on CPU below if they're offloaded to CPU)
+        self._sync_offloaded_state(inference_state)
         batch_size = self._get_obj_num(inference_state)
         storage_key = "cond_frame_outputs" if is_cond else "non_cond_frame_outputs"
         # Optionally, we allow consolidating the temporary outputs at the original
@@ -470,6 +1038,9 @@ class SAM2VideoPredictor(SAM2Base):
             ),
         }
         empty_mask_ptr = None
+        # object masks with a different resolution, grouped by their resolution so that
+        # they can be resized all at once (instead of once per object)
+        masks_to_resize = {}  # {(H, W): ([obj_idx, ...], [obj_mask, ...])}
         for obj_idx in range(batch_size):
             obj_temp_output_dict = inference_state["temp_output_dict_per_obj"][obj_idx]
             obj_output_dict = inference_state["output_dict_per_obj"][obj_idx]
@@ -498,21 +1069,34 @@ class SAM2VideoPredictor(SAM2Base):
                     consolidated_out["obj_ptr"][obj_idx : obj_idx + 1] = empty_mask_ptr
                 continue
             # Add the temporary object output mask to consolidated output mask
-            obj_mask = out["pred_masks"]
+            obj_mask = dequantize(out["pred_masks"], dtype=torch.float32)
             consolidated_pred_masks = consolidated_out[consolidated_mask_key]
             if obj_mask.shape[-2:] == consolidated_pred_masks.shape[-2:]:
                 consolidated_pred_masks[obj_idx : obj_idx + 1] = obj_mask
             else:
-                # Resize first if temporary object mask has a different resolution
-                resized_obj_mask = torch.nn.functional.interpolate(
-                    obj_mask,
-                    size=consolidated_pred_masks.shape[-2:],
-                    mode="bilinear",
-                    align_corners=False,
-                )
-                consolidated_pred_masks[obj_idx : obj_idx + 1] = resized_obj_mask
+                # Resize later if temporary object mask has a different resolution
+                obj_inds, obj_masks = masks_to_resize.setdefault(
+                    tuple(obj_mask.shape[-2:]), ([], [])
+                )
+                obj_inds.append(obj_idx)
+                obj_masks.append(obj_mask)
             consolidated_out["obj_ptr"][obj_idx : obj_idx + 1] = out["obj_ptr"]
 
+        # Resize the object masks with a different resolution in a single batch
+        consolidated_pred_masks = consolidated_out[consolidated_mask_key]
+        for obj_inds, obj_masks in masks_to_resize.values():
+            resized_obj_masks = torch.nn.functional.interpolate(
+                torch.cat(obj_masks, dim=0).to(consolidated_pred_masks.device),
+                size=consolidated_pred_masks.shape[-2:],
+                mode="bilinear",
+                align_corners=False,
+            )
+            if len(obj_inds) == batch_size:
+                consolidated_pred_masks.copy_(resized_obj_masks)
+            else:
+                obj_inds = torch.tensor(obj_inds, device=resized_obj_masks.device)
+                consolidated_pred_masks.index_copy_(0, obj_inds, resized_obj_masks)
+
         # Optionally, apply non-overlapping constraints on the consolidated scores
         # and rerun the memory encoder
         if run_mem_encoder:
@@ -576,8 +1160,11 @@ class SAM2VideoPredictor(SAM2Base):
     @torch.inference_mode()
     def propagate_in_video_preflight(self, inference_state):
         """Prepare inference_state and consolidate temporary outputs before tracking."""
-        # Tracking has started and we don't allow adding new objects until session is reset.
+        # Tracking has started, so any new objects added from now on get a slot in the
+        # existing outputs (see `_add_object_slot_to_outputs`).
         inference_state["tracking_has_started"] = True
+        # the tracking outputs may change from now on
+        inference_state["interactive_video_res_masks"] = None
         batch_size = self._get_obj_num(inference_state)
 
         # Consolidate per-object temporary outputs in "temp_output_dict_per_obj" and
@@ -595,14 +1182,22 @@ class SAM2VideoPredictor(SAM2Base):
             # (these should be the frames that have just received clicks for mask inputs
             # via `add_new_points_or_box` or `add_new_mask`)
             temp_frame_inds = set()
-            for obj_temp_output_dict in temp_output_dict_per_obj.values():
+            for obj_idx, obj_temp_output_dict in temp_output_dict_per_obj.items():
                 temp_frame_inds.update(obj_temp_output_dict[storage_key].keys())
+                if len(obj_temp_output_dict[storage_key]) > 0:
+                    # this object needs to be re-tracked in both directions
+                    obj_id = self._obj_idx_to_id(inference_state, obj_idx)
+                    for dirty_obj_ids in inference_state["dirty_obj_ids"].values():
+                        dirty_obj_ids.add(obj_id)
             consolidated_frame_inds[storage_key].update(temp_frame_inds)
             # consolidate the temporary output across all objects on this frame
             for frame_idx in temp_frame_inds:
                 consolidated_out = self._consolidate_temp_output_across_obj(
                     inference_state, frame_idx, is_cond=is_cond, run_mem_encoder=True
                 )
+                consolidated_out["pred_masks"] = self._get_stored_pred_masks(
+                    inference_state, consolidated_out["pred_masks"]
+                )
                 # merge them into "output_dict" and also create per-object slices
                 output_dict[storage_key][frame_idx] = consolidated_out
                 self._add_output_per_object(
@@ -642,6 +1237,8 @@ class SAM2VideoPredictor(SAM2Base):
         for mask_inputs_per_frame in inference_state["mask_inputs_per_obj"].values():
             input_frames_inds.update(mask_inputs_per_frame.keys())
         assert all_consolidated_frame_inds == input_frames_inds
+        if inference_state["num_frames"] is None:
+            self._store_empty_mask_memory(inference_state)
 
     @torch.inference_mode()
     def propagate_in_video(
@@ -650,17 +1247,105 @@ class SAM2VideoPredictor(SAM2Base):
         start_frame_idx=None,
         max_frame_num_to_track=None,
         reverse=False,
+        prefetch_batch_size=1,
+        pipeline_depth=0,
+        obj_ids=None,
+        obj_chunk_size=None,
+        convergence_iou_thresh=None,
+        convergence_num_frames=None,
+        convergence_memory_tol=0.05,
+        only_dirty_objects=False,
+        output_mode="video_res_logits",
+        output_obj_ids=None,
+        frame_stride=1,
+        interpolate_skipped_frames=False,
     ):
-        """Propagate the input points across frames to track in the entire video."""
+        """
+        Propagate the input points across frames to track in the entire video.
+
+        With `obj_ids`, only these objects are tracked (each one separately on its own
+        memory) and their results are yielded, while the results of all other objects
+        are left untouched. This is e.g. to track an object added after the tracking
+        has started, without re-tracking all the other objects.
+
+        With `only_dirty_objects=True` (and no `obj_ids`), only the objects that got
+        new inputs since they were last propagated in this direction are re-tracked,
+        e.g. to re-propagate a single corrected object while keeping the results of all
+        the other objects as they are. All objects are tracked together if they are
+        all dirty, or if the non-overlapping constraints in the memory encoder couple
+        them. Nothing is tracked if no object got new inputs.
+
+        The yielded masks are in `output_mode` (see `_get_output_masks`), e.g. binary
+        masks or their RLEs instead of the mask logits at the video resolution, and
+        with `output_obj_ids`, only the masks of these objects are yielded (without
+        changing which objects are tracked).
+
+        With `prefetch_batch_size > 1`, the image features of the next frames to track
+        are computed together in one batched forward pass of the image encoder (which
+        doesn't depend on the tracking states) before tracking those frames.
+
+        With `pipeline_depth > 0`, the frames are decoded and encoded by the image
+        encoder in background threads while the previous frames are being tracked, with
+        up to `pipeline_depth` frames queued between each stage. The outputs are still
+        yielded in the same order as in the sequential propagation.
+
+        With `obj_chunk_size`, the objects are tracked on each frame in chunks of up to
+        this many objects (reusing the frame's image features across the chunks), which
+        caps the peak memory of the memory attention with many objects in the session.
+        It gives the same results as tracking all objects in one batch.
+
+        With `convergence_iou_thresh`, re-propagation (e.g. after correction clicks)
+        stops early once the new results converge to the results already tracked in
+        the same direction, i.e. once the new masks of all objects have an IoU of at
+        least `convergence_iou_thresh` with the previous masks and the new memory
+        features and object pointers differ from the previous ones by at most
+        `convergence_memory_tol` (in relative L2 norm), on `convergence_num_frames`
+        consecutive frames (by default, the memory horizon, so that the memory of the
+        next frame is equivalent to that in the previous results). The previous results
+        on the remaining frames are then kept as they are and not yielded again. (This
+        only applies when tracking all the objects, i.e. without `obj_ids`.)
+
+        With `frame_stride > 1`, only every `frame_stride`-th frame from the start frame
+        (and the frames with inputs) is tracked, as if they were consecutive frames of
+        a video at a lower frame rate (so the memory frames are taken among them every
+        `memory_temporal_stride_for_eval` of them). The frames in between are not
+        tracked and their image features are not computed (although their images may
+        still be loaded, e.g. in the background with `async_loading_frames=True`). With
+        `interpolate_skipped_frames=True`, the masks on the frames in between are also
+        yielded, by linearly interpolating the low-res mask logits of the tracked frames
+        around them, while the frames after the last tracked frame get its masks (but
+        they are not stored as tracking results). The yielded frame indices are always
+        those in the video. (This only applies when tracking all the objects, i.e.
+        without `obj_ids`.)
+        """
         self.propagate_in_video_preflight(inference_state)
 
         output_dict = inference_state["output_dict"]
         consolidated_frame_inds = inference_state["consolidated_frame_inds"]
-        obj_ids = inference_state["obj_ids"]
         num_frames = inference_state["num_frames"]
         batch_size = self._get_obj_num(inference_state)
-        if len(output_dict["cond_frame_outputs"]) == 0:
-            raise RuntimeError("No points are provided; please add points first")
+        if num_frames is None:
+            raise RuntimeError(
+                "Cannot propagate in a streaming session; please use push_frame instead"
+            )
+        if only_dirty_objects and obj_ids is None:
+            obj_ids = self._get_dirty_obj_ids(inference_state, [reverse])
+            if obj_ids is not None and len(obj_ids) == 0:
+                return  # no object got new inputs since it was last propagated
+        if obj_ids is None:
+            obj_indices = None
+            obj_ids = inference_state["obj_ids"]
+        else:
+            obj_indices = self._get_obj_indices(inference_state, obj_ids)
+        output_obj_indices = None
+        if output_obj_ids is not None:
+            if any(i not in obj_ids for i in output_obj_ids):
+                raise ValueError(
+                    f"output_obj_ids {output_obj_ids} must be among the tracked object "
+                    f"ids {obj_ids}"
+                )
+            output_obj_indices = self._get_obj_indices(inference_state, output_obj_ids)
+        cond_frame_inds = self._get_cond_frame_inds(inference_state, obj_indices)
         clear_non_cond_mem = self.clear_non_cond_mem_around_input and (
             self.clear_non_cond_mem_for_multi_obj or batch_size <= 1
         )
@@ -668,21 +1353,67 @@ class SAM2VideoPredictor(SAM2Base):
         # set start index, end index, and processing order
         if start_frame_idx is None:
             # default: start from the earliest frame with input points
-            start_frame_idx = min(output_dict["cond_frame_outputs"])
-        if max_frame_num_to_track is None:
-            # default: track all the frames in the video
-            max_frame_num_to_track = num_frames
-        if reverse:
-            end_frame_idx = max(start_frame_idx - max_frame_num_to_track, 0)
-            if start_frame_idx > 0:
-                processing_order = range(start_frame_idx, end_frame_idx - 1, -1)
-            else:
-                processing_order = []  # skip reverse tracking if starting from frame 0
-        else:
-            end_frame_idx = min(
-                start_frame_idx + max_frame_num_to_track, num_frames - 1
+            start_frame_idx = min(cond_frame_inds)
+        processing_order = self._get_processing_order(
+            num_frames, start_frame_idx, max_frame_num_to_track, reverse
+        )
+        frame_inds_with_inputs = (
+            consolidated_frame_inds["cond_frame_outputs"]
+            | consolidated_frame_inds["non_cond_frame_outputs"]
+        )
+        last_frame_idx = processing_order[-1] if len(processing_order) > 0 else None
+        if frame_stride > 1:
+            if obj_indices is not None:
+                raise ValueError(
+                    "frame_stride is not supported when tracking a subset of objects"
+                )
+            # track every `frame_stride`-th frame and the frames with inputs in between
+            frames_to_track = set(processing_order[::frame_stride])
+            frames_to_track.update(
+                frame_inds_with_inputs.intersection(processing_order)
             )
-            processing_order = range(start_frame_idx, end_frame_idx + 1)
+            processing_order = sorted(frames_to_track, reverse=reverse)
+
+        if obj_indices is not None:
+            yield from self._propagate_objects_in_video(
+                inference_state,
+                obj_indices,
+                processing_order,
+                reverse=reverse,
+                prefetch_batch_size=prefetch_batch_size,
+                pipeline_depth=pipeline_depth,
+                output_mode=output_mode,
+                output_obj_indices=output_obj_indices,
+            )
+            inference_state["dirty_obj_ids"][reverse].difference_update(obj_ids)
+            return
+
+        # Fill in the placeholder slots of the objects added after the tracking started
+        # (the other frames to track are tracked again before being used as memory)
+        self._fill_placeholder_outputs(
+            inference_state,
+            frames_to_track=set(processing_order) - frame_inds_with_inputs,
+            start_frame_idx=start_frame_idx,
+            reverse=reverse,
+            frame_stride=frame_stride,
+        )
+        # Optionally, compute the image features ahead of tracking, either in batches
+        # (`prefetch_batch_size > 1`) or in background threads (`pipeline_depth > 0`).
+        # The features on each frame are put into the feature cache right before tracking
+        # it. (Any background threads are stopped once this generator is closed.)
+        frame_features, prefetch_frame_inds = self._prefetch_frame_features(
+            inference_state,
+            [t for t in processing_order if t not in frame_inds_with_inputs],
+            prefetch_batch_size=prefetch_batch_size,
+            pipeline_depth=pipeline_depth,
+        )
+        check_convergence = convergence_iou_thresh is not None
+        if convergence_num_frames is None:
+            convergence_num_frames = self._get_memory_horizon()
+        num_converged_frames = 0
+        out_obj_ids = obj_ids if output_obj_ids is None else output_obj_ids
+        prev_frame_idx, prev_pred_masks = None, None
+        converged = False
 
         for frame_idx in tqdm(processing_order, desc="propagate in video"):
             # We skip those frames already in consolidated outputs (these are frames
@@ -702,73 +1433,725 @@ class SAM2VideoPredictor(SAM2Base):
                 pred_masks = current_out["pred_masks"]
             else:
                 storage_key = "non_cond_frame_outputs"
-                current_out, pred_masks = self._run_single_frame_inference(
-                    inference_state=inference_state,
-                    output_dict=output_dict,
-                    frame_idx=frame_idx,
-                    batch_size=batch_size,
-                    is_init_cond_frame=False,
-                    point_inputs=None,
-                    mask_inputs=None,
-                    reverse=reverse,
-                    run_mem_encoder=True,
-                )
+                # the previous output on this frame (if tracked in the same direction)
+                prev_out = None
+                prev_tracked = inference_state["frames_already_tracked"].get(frame_idx)
+                if prev_tracked is not None and prev_tracked["reverse"] == reverse:
+                    prev_out = output_dict[storage_key].get(frame_idx, None)
+                features = None
+                if frame_idx in prefetch_frame_inds:
+                    features = self._put_prefetched_features(
+                        inference_state, frame_idx, frame_features
+                    )
+                if obj_chunk_size is not None and batch_size > obj_chunk_size:
+                    current_out, pred_masks = self._run_frame_inference_in_chunks(
+                        inference_state=inference_state,
+                        frame_idx=frame_idx,
+                        batch_size=batch_size,
+                        obj_chunk_size=obj_chunk_size,
+                        reverse=reverse,
+                        frame_stride=frame_stride,
+                        frame_features=features,
+                    )
+                else:
+                    current_out, pred_masks = self._run_single_frame_inference(
+                        inference_state=inference_state,
+                        output_dict=output_dict,
+                        frame_idx=frame_idx,
+                        batch_size=batch_size,
+                        is_init_cond_frame=False,
+                        point_inputs=None,
+                        mask_inputs=None,
+                        reverse=reverse,
+                        run_mem_encoder=True,
+                        frame_stride=frame_stride,
+                        frame_features=features,
+                    )
                 output_dict[storage_key][frame_idx] = current_out
+                if check_convergence:
+                    if prev_out is not None and self._is_output_converged(
+                        current_out,
+                        prev_out,
+                        convergence_iou_thresh,
+                        convergence_memory_tol,
+                    ):
+                        num_converged_frames += 1
+                    else:
+                        num_converged_frames = 0
             # Create slices of per-object outputs for subsequent interaction with each
             # individual object after tracking.
             self._add_output_per_object(
                 inference_state, frame_idx, current_out, storage_key
             )
             inference_state["frames_already_tracked"][frame_idx] = {"reverse": reverse}
+            if inference_state["evict_stale_outputs"]:
+                self._evict_stale_outputs(
+                    inference_state, frame_idx, reverse, start_frame_idx, frame_stride
+                )
+
+            # Optionally, interpolate the low-res mask logits on the skipped frames
+            # between the previously tracked frame and this frame
+            if interpolate_skipped_frames:
+                pred_masks = dequantize(
+                    pred_masks,
+                    inference_state["device"],
+                    torch.float32,
+                    non_blocking=True,
+                )
+                if prev_frame_idx is not None:
+                    step = -1 if reverse else 1
+                    num_steps = abs(frame_idx - prev_frame_idx)
+                    for t in range(prev_frame_idx + step, frame_idx, step):
+                        weight = abs(t - prev_frame_idx) / num_steps
+                        interp_masks = torch.lerp(prev_pred_masks, pred_masks, weight)
+                        out_masks = self._get_output_masks(
+                            inference_state,
+                            interp_masks,
+                            output_mode,
+                            output_obj_indices,
+                        )
+                        yield t, out_obj_ids, out_masks
+                prev_frame_idx, prev_pred_masks = frame_idx, pred_masks
 
             # Resize the output mask to the original video resolution (we directly use
             # the mask scores on GPU for output to avoid any CPU conversion in between)
-            _, video_res_masks = self._get_orig_video_res_output(
-                inference_state, pred_masks
+            out_masks = self._get_output_masks(
+                inference_state, pred_masks, output_mode, output_obj_indices
             )
-            yield frame_idx, obj_ids, video_res_masks
+            yield frame_idx, out_obj_ids, out_masks
+
+            if check_convergence and num_converged_frames >= convergence_num_frames:
+                # the new results have converged to the previous ones, which we keep
+                # on the remaining frames
+                converged = True
+                break
+
+        # Yield the skipped frames after the last tracked frame with its masks (as there
+        # is no later tracked frame to interpolate them with)
+        if interpolate_skipped_frames and prev_frame_idx is not None and not converged:
+            step = -1 if reverse else 1
+            for t in range(prev_frame_idx + step, last_frame_idx + step, step):
+                out_masks = self._get_output_masks(
+                    inference_state, prev_pred_masks, output_mode, output_obj_indices
+                )
+                yield t, out_obj_ids, out_masks
 
-    def _add_output_per_object(
-        self, inference_state, frame_idx, current_out, storage_key
+        inference_state["dirty_obj_ids"][reverse].difference_update(obj_ids)
+
+    def _get_processing_order(
+        self, num_frames, start_frame_idx, max_frame_num_to_track, reverse
     ):
+        """Get the frames to track from `start_frame_idx` in the processing order."""
+        if max_frame_num_to_track is None:
+            # default: track all the frames in the video
+            max_frame_num_to_track = num_frames
+        if reverse:
+            end_frame_idx = max(start_frame_idx - max_frame_num_to_track, 0)
+            if start_frame_idx > 0:
+                processing_order = range(start_frame_idx, end_frame_idx - 1, -1)
+            else:
+                processing_order = []  # skip reverse tracking if starting from frame 0
+        else:
+            end_frame_idx = min(
+                start_frame_idx + max_frame_num_to_track, num_frames - 1
+            )
+            processing_order = range(start_frame_idx, end_frame_idx + 1)
+        return processing_order
+
+    def _get_dirty_obj_ids(self, inference_state, directions):
         """
-        Split a multi-object output into per-object output slices and add them into
-        `output_dict_per_obj`. The resulting slices share the same tensor storage.
+        Get the ids of the objects that got new inputs since they were last propagated
+        in any of the `directions` (a list of `reverse` flags), or `None` if all the
+        objects need to be tracked together.
         """
-        maskmem_features = current_out["maskmem_features"]
-        assert maskmem_features is None or isinstance(maskmem_features, torch.Tensor)
-
-        maskmem_pos_enc = current_out["maskmem_pos_enc"]
-        assert maskmem_pos_enc is None or isinstance(maskmem_pos_enc, list)
-
-        output_dict_per_obj = inference_state["output_dict_per_obj"]
-        for obj_idx, obj_output_dict in output_dict_per_obj.items():
-            obj_slice = slice(obj_idx, obj_idx + 1)
-            obj_out = {
-                "maskmem_features": None,
-                "maskmem_pos_enc": None,
-                "pred_masks": current_out["pred_masks"][obj_slice],
-                "obj_ptr": current_out["obj_ptr"][obj_slice],
-            }
-            if maskmem_features is not None:
-                obj_out["maskmem_features"] = maskmem_features[obj_slice]
-            if maskmem_pos_enc is not None:
-                obj_out["maskmem_pos_enc"] = [x[obj_slice] for x in maskmem_pos_enc]
-            obj_output_dict[storage_key][frame_idx] = obj_out
+        dirty_obj_ids = set()
+        for reverse in directions:
+            dirty_obj_ids.update(inference_state["dirty_obj_ids"][reverse])
+        obj_ids = [i for i in inference_state["obj_ids"] if i in dirty_obj_ids]
+        if self.non_overlap_masks_for_mem_enc:
+            # the non-overlapping constraints couple the memories of all the objects
+            return None
+        if len(obj_ids) == self._get_obj_num(inference_state):
+            return None
+        return obj_ids
+
+    def _is_output_converged(self, current_out, prev_out, iou_thresh, memory_tol):
+        """
+        Check whether a frame's new output matches its previous output, i.e. the masks
+        of all objects have an IoU of at least `iou_thresh` and their memory features
+        and object pointers differ by at most `memory_tol` in relative L2 norm.
+        """
+        # (compare them on the compute device, where the object pointers are kept)
+        device = current_out["obj_ptr"].device
+        new_masks = dequantize(current_out["pred_masks"], device) > 0
+        prev_masks = dequantize(prev_out["pred_masks"], device) > 0
+        if new_masks.shape != prev_masks.shape:
+            return False
+        intersection = (new_masks & prev_masks).flatten(1).sum(dim=1)
+        union = (new_masks | prev_masks).flatten(1).sum(dim=1)
+        # empty masks in both outputs count as a perfect match
+        ious = intersection / union.clamp(min=1)
+        ious[union == 0] = 1.0
+        if (ious < iou_thresh).any():
+            return False
+        for key in ["maskmem_features", "obj_ptr"]:
+            if current_out[key] is None or prev_out[key] is None:
+                continue
+            new_x = dequantize(current_out[key], device, torch.float32).flatten(1)
+            prev_x = dequantize(prev_out[key], device, torch.float32).flatten(1)
+            diff_norm = (new_x - prev_x).norm(dim=1)
+            prev_norm = prev_x.norm(dim=1).clamp(min=1e-6)
+            if (diff_norm > memory_tol * prev_norm).any():
+                return False
+        return True
+
+    def _get_cond_frame_inds(self, inference_state, obj_indices=None):
+        """
+        Get the conditioning frames (for all objects or only those in `obj_indices`) to
+        start the tracking from, which must be non-empty for each tracked object.
+        """
+        output_dict = inference_state["output_dict"]
+        if obj_indices is None:
+            cond_frame_inds = set(output_dict["cond_frame_outputs"])
+        else:
+            output_dict_per_obj = inference_state["output_dict_per_obj"]
+            cond_frame_inds = set()
+            for obj_idx in obj_indices:
+                obj_output_dict = output_dict_per_obj[obj_idx]
+                if len(obj_output_dict["cond_frame_outputs"]) == 0:
+                    obj_id = self._obj_idx_to_id(inference_state, obj_idx)
+                    raise RuntimeError(
+                        f"No points are provided for object id {obj_id}; please add "
+                        "points first"
+                    )
+                cond_frame_inds.update(obj_output_dict["cond_frame_outputs"])
+        if len(cond_frame_inds) == 0:
+            raise RuntimeError("No points are provided; please add points first")
+        return cond_frame_inds
 
     @torch.inference_mode()
-    def reset_state(self, inference_state):
-        """Remove all input points or mask in all frames throughout the video."""
-        self._reset_tracking_results(inference_state)
-        # Remove all object ids
-        inference_state["obj_id_to_idx"].clear()
-        inference_state["obj_idx_to_id"].clear()
-        inference_state["obj_ids"].clear()
-        inference_state["point_inputs_per_obj"].clear()
-        inference_state["mask_inputs_per_obj"].clear()
+    def propagate_in_video_bidirectional(
+        self,
+        inference_state,
+        start_frame_idx=None,
+        max_frame_num_to_track=None,
+        prefetch_batch_size=1,
+        pipeline_depth=0,
+        obj_ids=None,
+        obj_chunk_size=None,
+        only_dirty_objects=False,
+        output_mode="video_res_logits",
+        output_obj_ids=None,
+    ):
+        """
+        Propagate the input points both forward and backward from `start_frame_idx` in
+        a single pass, yielding the per-frame results of both directions as they are
+        tracked (each frame is yielded once, in an interleaved order).
+
+        Each direction computes and prefetches the image features on its own frames (see
+        `prefetch_batch_size` and `pipeline_depth`). The forward pass is kept ahead of
+        the backward pass by the memory horizon, which gives the same results as first
+        calling `propagate_in_video` forward and then backward from a prompted frame.
+        Under `evict_stale_outputs`, the forward outputs within the memory horizon of
+        the start frame are kept until the backward pass has moved past them, as they
+        are its memory (as in the sequential calls without eviction).
+
+        With `only_dirty_objects=True` (and no `obj_ids`), only the objects that got
+        new inputs since they were last propagated in either direction are re-tracked
+        (see `propagate_in_video`, also for `output_mode` and `output_obj_ids`).
+        """
+        self.propagate_in_video_preflight(inference_state)
+        if only_dirty_objects and obj_ids is None:
+            obj_ids = self._get_dirty_obj_ids(inference_state, [False, True])
+            if obj_ids is not None and len(obj_ids) == 0:
+                return  # no object got new inputs since it was last propagated
+        if start_frame_idx is None:
+            obj_indices = None
+            if obj_ids is not None:
+                obj_indices = self._get_obj_indices(inference_state, obj_ids)
+            cond_frame_inds = self._get_cond_frame_inds(inference_state, obj_indices)
+            start_frame_idx = min(cond_frame_inds)
+        propagate_kwargs = {
+            "prefetch_batch_size": prefetch_batch_size,
+            "pipeline_depth": pipeline_depth,
+            "obj_ids": obj_ids,
+            "obj_chunk_size": obj_chunk_size,
+            "output_mode": output_mode,
+            "output_obj_ids": output_obj_ids,
+        }
+        forward_outputs = self.propagate_in_video(
+            inference_state,
+            start_frame_idx=start_frame_idx,
+            max_frame_num_to_track=max_frame_num_to_track,
+            reverse=False,
+            **propagate_kwargs,
+        )
+        # The backward pass starts from the frame before the start frame, so that the
+        # start frame is only tracked (and yielded) once by the forward pass, and the
+        # backward pass uses its stored forward output as memory. (From frame 0, the
+        # backward pass has no frames to track.)
+        backward_max_frame_num_to_track = max_frame_num_to_track
+        if start_frame_idx > 0 and max_frame_num_to_track is not None:
+            backward_max_frame_num_to_track = max_frame_num_to_track - 1
+        backward_outputs = self.propagate_in_video(
+            inference_state,
+            start_frame_idx=max(start_frame_idx - 1, 0),
+            max_frame_num_to_track=backward_max_frame_num_to_track,
+            reverse=True,
+            **propagate_kwargs,
+        )
+        # When tracking backward, a frame uses the frames after it as its memory, which
+        # can be on the other side of the start frame within the memory horizon. So we
+        # first track forward for this many frames (as the backward pass would see them
+        # in sequential propagation), and then alternate between the two directions.
+        # This also ensures that the forward pass never sees the backward outputs.
+        horizon = self._get_memory_horizon()
+
+        def _interleave_outputs():
+            # (yield the direction of each output along with it)
+            for out in itertools.islice(forward_outputs, horizon + 1):
+                yield False, out
+            for forward_out, backward_out in itertools.zip_longest(
+                forward_outputs, backward_outputs
+            ):
+                if forward_out is not None:
+                    yield False, forward_out
+                if backward_out is not None:
+                    yield True, backward_out
+
+        # Under `evict_stale_outputs`, we evict the stale outputs here instead of in each
+        # pass, so that the forward pass doesn't evict the outputs that the backward pass
+        # still uses as memory, i.e. those up to the memory horizon from its current
+        # frame. (The subset of objects in `obj_ids` are tracked without eviction.)
+        evict_stale_outputs = inference_state["evict_stale_outputs"]
+        evict_here = evict_stale_outputs and obj_ids is None
+        backward_frame_idx = start_frame_idx
+        try:
+            if evict_here:
+                inference_state["evict_stale_outputs"] = False
+            for reverse, out in _interleave_outputs():
+                frame_idx = out[0]
+                if evict_here and reverse:
+                    backward_frame_idx = frame_idx
+                    self._evict_stale_outputs(
+                        inference_state, frame_idx, reverse, start_frame_idx
+                    )
+                elif evict_here:
+                    self._evict_stale_outputs(
+                        inference_state,
+                        frame_idx,
+                        reverse,
+                        max(start_frame_idx, backward_frame_idx + horizon + 1),
+                    )
+                yield out
+        finally:
+            inference_state["evict_stale_outputs"] = evict_stale_outputs
+
+    @torch.inference_mode()
+    def propagate_in_videos(
+        self, inference_states, max_frame_num_to_track=None, reverse=False
+    ):
+        """
+        Propagate the input points in several inference sessions (e.g. on different
+        videos) together, advancing every session by one frame on each step. It yields
+        (session_idx, frame_idx, obj_ids, video_res_masks), where `session_idx` is the
+        position of the session in `inference_states`.
+
+        On each step, the image encoder runs once on the current frames of all sessions,
+        and the objects of all sessions are tracked as one batch through the SAM heads
+        and the memory encoder. The memory attention runs once per group of sessions
+        with the same number of memory tokens (e.g. sessions with the same number of
+        conditioning frames that are at least `num_maskmem` frames into tracking), as
+        the memories can't be padded to the same length without changing the attention.
+        Each session gets the same results as `propagate_in_video` on its own.
+        """
+        processing_orders = []
+        for inference_state in inference_states:
+            self.propagate_in_video_preflight(inference_state)
+            num_frames = inference_state["num_frames"]
+            if num_frames is None:
+                raise RuntimeError(
+                    "Cannot propagate in a streaming session; please use push_frame "
+                    "instead"
+                )
+            # start from the earliest frame with input points in each session
+            start_frame_idx = min(self._get_cond_frame_inds(inference_state))
+            processing_order = self._get_processing_order(
+                num_frames, start_frame_idx, max_frame_num_to_track, reverse
+            )
+            processing_orders.append(processing_order)
+            # fill in the placeholder slots of the objects added after the tracking
+            # started (as in `propagate_in_video`)
+            consolidated_frame_inds = inference_state["consolidated_frame_inds"]
+            frame_inds_with_inputs = (
+                consolidated_frame_inds["cond_frame_outputs"]
+                | consolidated_frame_inds["non_cond_frame_outputs"]
+            )
+            self._fill_placeholder_outputs(
+                inference_state,
+                frames_to_track=set(processing_order) - frame_inds_with_inputs,
+                start_frame_idx=start_frame_idx,
+                reverse=reverse,
+            )
+
+        num_steps = max((len(order) for order in processing_orders), default=0)
+        for step in tqdm(range(num_steps), desc="propagate in videos"):
+            outputs = {}  # {session_idx: (frame_idx, storage_key, current_out, masks)}
+            sessions_to_track = []
+            for session_idx, processing_order in enumerate(processing_orders):
+                if step >= len(processing_order):
+                    continue  # this session is done
+                inference_state = inference_states[session_idx]
+                frame_idx = processing_order[step]
+                output_dict = inference_state["output_dict"]
+                consolidated_frame_inds = inference_state["consolidated_frame_inds"]
+                # Frames with inputs are skipped as in `propagate_in_video`, while all
+                # other frames are tracked together in a batch below.
+                if frame_idx in consolidated_frame_inds["cond_frame_outputs"]:
+                    storage_key = "cond_frame_outputs"
+                    batch_size = self._get_obj_num(inference_state)
+                    clear_non_cond_mem = self.clear_non_cond_mem_around_input and (
+                        self.clear_non_cond_mem_for_multi_obj or batch_size <= 1
+                    )
+                    if clear_non_cond_mem:
+                        # clear non-conditioning memory of the surrounding frames
+                        self._clear_non_cond_mem_around_input(
+                            inference_state, frame_idx
+                        )
+                elif frame_idx in consolidated_frame_inds["non_cond_frame_outputs"]:
+                    storage_key = "non_cond_frame_outputs"
+                else:
+                    sessions_to_track.append(session_idx)
+                    continue
+                current_out = output_dict[storage_key][frame_idx]
+                pred_masks = current_out["pred_masks"]
+                outputs[session_idx] = (frame_idx, storage_key, current_out, pred_masks)
+
+            tracked_outputs = self._run_multi_session_inference(
+                [inference_states[i] for i in sessions_to_track],
+                [processing_orders[i][step] for i in sessions_to_track],
+                reverse=reverse,
+            )
+            for session_idx, (current_out, pred_masks) in zip(
+                sessions_to_track, tracked_outputs
+            ):
+                frame_idx = processing_orders[session_idx][step]
+                storage_key = "non_cond_frame_outputs"
+                output_dict = inference_states[session_idx]["output_dict"]
+                output_dict[storage_key][frame_idx] = current_out
+                outputs[session_idx] = (frame_idx, storage_key, current_out, pred_masks)
+
+            for session_idx in sorted(outputs):
+                frame_idx, storage_key, current_out, pred_masks = outputs[session_idx]
+                inference_state = inference_states[session_idx]
+                self._add_output_per_object(
+                    inference_state, frame_idx, current_out, storage_key
+                )
+                inference_state["frames_already_tracked"][frame_idx] = {
+                    "reverse": reverse
+                }
+                if inference_state["evict_stale_outputs"]:
+                    start_frame_idx = processing_orders[session_idx][0]
+                    self._evict_stale_outputs(
+                        inference_state, frame_idx, reverse, start_frame_idx
+                    )
+                _, video_res_masks = self._get_orig_video_res_output(
+                    inference_state, pred_masks
+                )
+                obj_ids = inference_state["obj_ids"]
+                yield session_idx, frame_idx, obj_ids, video_res_masks
+
+        # all the objects in each session are now tracked in this direction
+        for inference_state in inference_states:
+            inference_state["dirty_obj_ids"][reverse].clear()
+
+    def _propagate_objects_in_video(
+        self,
+        inference_state,
+        obj_indices,
+        processing_order,
+        reverse,
+        prefetch_batch_size,
+        pipeline_depth,
+        output_mode="video_res_logits",
+        output_obj_indices=None,
+    ):
+        """
+        Track only the objects in `obj_indices` in `processing_order`, each one on the
+        memory in its own "output_dict_per_obj" (sharing the image features on each
+        frame), and write their outputs into their slots in "output_dict" in place.
+        The masks of the objects in `output_obj_indices` (by default, all the tracked
+        objects) are yielded in `output_mode`.
+        """
+        num_objs = self._get_obj_num(inference_state)
+        if self.non_overlap_masks_for_mem_enc and num_objs > 1:
+            warnings.warn(
+                "Tracking a subset of objects doesn't apply non-overlapping "
+                "constraints on the memory across objects (i.e. "
+                "`non_overlap_masks_for_mem_enc`), so the results may differ "
+                "slightly from tracking all objects together.",
+                category=UserWarning,
+                stacklevel=3,
+            )
+        if output_obj_indices is None:
+            output_obj_indices = obj_indices
+        obj_ids = [self._obj_idx_to_id(inference_state, i) for i in output_obj_indices]
+        output_dict = inference_state["output_dict"]
+        output_dict_per_obj = inference_state["output_dict_per_obj"]
+        consolidated_frame_inds = inference_state["consolidated_frame_inds"]
+        # The outputs on the frames with inputs (which are consolidated in preflight)
+        # are directly used, unless the object only holds a placeholder there (i.e. it
+        # was added after this frame was consolidated).
+        frame_inds_with_inputs = (
+            consolidated_frame_inds["cond_frame_outputs"]
+            | consolidated_frame_inds["non_cond_frame_outputs"]
+        )
+        frame_inds_to_skip = {}
+        for obj_idx in obj_indices:
+            obj_output_dict = output_dict_per_obj[obj_idx]
+            frame_inds_to_skip[obj_idx] = {
+                t
+                for t in frame_inds_with_inputs
+                if t in obj_output_dict["cond_frame_outputs"]
+                or t in obj_output_dict["non_cond_frame_outputs"]
+            }
+        frame_features, prefetch_frame_inds = self._prefetch_frame_features(
+            inference_state,
+            [
+                t
+                for t in processing_order
+                if any(t not in frame_inds_to_skip[i] for i in obj_indices)
+            ],
+            prefetch_batch_size=prefetch_batch_size,
+            pipeline_depth=pipeline_depth,
+        )
+
+        for frame_idx in tqdm(processing_order, desc="propagate in video"):
+            features = None
+            if frame_idx in prefetch_frame_inds:
+                features = self._put_prefetched_features(
+                    inference_state, frame_idx, frame_features
+                )
+            for obj_idx in obj_indices:
+                if frame_idx in frame_inds_to_skip[obj_idx]:
+                    continue
+                obj_out, _ = self._run_single_frame_inference(
+                    inference_state=inference_state,
+                    output_dict=output_dict_per_obj[obj_idx],
+                    frame_idx=frame_idx,
+                    batch_size=1,
+                    is_init_cond_frame=False,
+                    point_inputs=None,
+                    mask_inputs=None,
+                    reverse=reverse,
+                    run_mem_encoder=True,
+                    frame_features=features,
+                )
+                self._set_obj_output(inference_state, frame_idx, obj_idx, obj_out)
+            inference_state["frames_already_tracked"].setdefault(
+                frame_idx, {"reverse": reverse}
+            )
+
+            # Resize the output mask to the original video resolution (with the other
+            # objects' masks if we need to apply non-overlapping constraints on them)
+            if self.non_overlap_masks:
+                out = output_dict["cond_frame_outputs"].get(frame_idx, None)
+                if out is None:
+                    out = output_dict["non_cond_frame_outputs"][frame_idx]
+                out_masks = self._get_output_masks(
+                    inference_state, out["pred_masks"], output_mode, output_obj_indices
+                )
+            else:
+                pred_masks = []
+                for obj_idx in output_obj_indices:
+                    obj_output_dict = output_dict_per_obj[obj_idx]
+                    obj_out = obj_output_dict["cond_frame_outputs"].get(frame_idx, None)
+                    if obj_out is None:
+                        obj_out = obj_output_dict["non_cond_frame_outputs"][frame_idx]
+                    pred_masks.append(
+                        dequantize(obj_out["pred_masks"], inference_state["device"])
+                    )
+                out_masks = self._get_output_masks(
+                    inference_state, torch.cat(pred_masks, dim=0), output_mode
+                )
+            yield frame_idx, obj_ids, out_masks
+
+    def _set_obj_output(self, inference_state, frame_idx, obj_idx, obj_out):
+        """
+        Write the output of a single object on a frame into its slot in the multi-object
+        output on this frame in "output_dict" (which is created with placeholder values
+        for the other objects if there isn't one yet) and into "output_dict_per_obj".
+        """
+        # (the outputs are accessed on CPU below if they're offloaded to CPU)
+        self._sync_offloaded_state(inference_state)
+        output_dict = inference_state["output_dict"]
+        out = output_dict["cond_frame_outputs"].get(frame_idx, None)
+        if out is None:
+            out = output_dict["non_cond_frame_outputs"].get(frame_idx, None)
+        if out is None:
+            # The other objects are not added to "output_dict_per_obj" on this frame,
+            # so their placeholder values are never used as their memory when tracking
+            # them alone (and they're filled in via `_fill_placeholder_outputs` before
+            # tracking all objects together).
+            batch_size = self._get_obj_num(inference_state)
+            pred_masks = obj_out["pred_masks"]
+            obj_ptr = obj_out["obj_ptr"]
+            out = {
+                "maskmem_features": None,
+                "maskmem_pos_enc": None,
+                "pred_masks": pred_masks.new_full(
+                    (batch_size,) + pred_masks.shape[1:], NO_OBJ_SCORE
+                ),
+                "obj_ptr": obj_ptr.new_zeros((batch_size,) + obj_ptr.shape[1:]),
+            }
+            output_dict["non_cond_frame_outputs"][frame_idx] = out
+        if out["maskmem_features"] is None:
+            maskmem_features = obj_out["maskmem_features"]
+            out["maskmem_features"] = maskmem_features.new_zeros(
+                (out["pred_masks"].size(0),) + maskmem_features.shape[1:]
+            )
+            out["maskmem_pos_enc"] = self._expand_maskmem_pos_enc(
+                inference_state, batch_size=out["pred_masks"].size(0)
+            )
+        obj_slice = slice(obj_idx, obj_idx + 1)
+        out["pred_masks"][obj_slice] = obj_out["pred_masks"]
+        out["obj_ptr"][obj_slice] = obj_out["obj_ptr"]
+        out["maskmem_features"][obj_slice] = obj_out["maskmem_features"]
+        # (this is always a non-conditioning output for this object, even if the other
+        # objects have conditioning outputs on this frame)
+        obj_output_dict = inference_state["output_dict_per_obj"][obj_idx]
+        obj_output_dict["non_cond_frame_outputs"].link(frame_idx)
+
+    def _add_output_per_object(
+        self, inference_state, frame_idx, current_out, storage_key, obj_indices=None
+    ):
+        """
+        Add a multi-object output (already stored in "output_dict") into the per-object
+        views in `output_dict_per_obj` (for all objects or only those in `obj_indices`).
+        The per-object slices are only created when looking them up in the views, so we
+        don't keep a dict of tensor slices for each object on each frame.
+        """
+        maskmem_features = current_out["maskmem_features"]
+        assert maskmem_features is None or isinstance(maskmem_features, torch.Tensor)
+
+        maskmem_pos_enc = current_out["maskmem_pos_enc"]
+        assert maskmem_pos_enc is None or isinstance(maskmem_pos_enc, list)
+
+        output_dict_per_obj = inference_state["output_dict_per_obj"]
+        if obj_indices is None:
+            obj_indices = output_dict_per_obj.keys()
+        for obj_idx in obj_indices:
+            output_dict_per_obj[obj_idx][storage_key].link(frame_idx)
+
+    @torch.inference_mode()
+    def reset_state(self, inference_state):
+        """Remove all input points or mask in all frames throughout the video."""
+        self._reset_tracking_results(inference_state)
+        # Remove all object ids
+        inference_state["obj_id_to_idx"].clear()
+        inference_state["obj_idx_to_id"].clear()
+        inference_state["obj_ids"].clear()
+        inference_state["point_inputs_per_obj"].clear()
+        inference_state["mask_inputs_per_obj"].clear()
         inference_state["output_dict_per_obj"].clear()
         inference_state["temp_output_dict_per_obj"].clear()
 
+    @torch.inference_mode()
+    def remove_object(self, inference_state, obj_id, strict=False):
+        """
+        Remove an object id from the tracking state, including its inputs and its slot
+        in the multi-object outputs (so that later tracking runs on fewer objects). The
+        other objects keep their inputs and tracking results. If `strict` is True, an
+        error is raised when removing a non-existent object id. It returns the object
+        ids that remain.
+        """
+        old_obj_idx = inference_state["obj_id_to_idx"].get(obj_id, None)
+        if old_obj_idx is None:
+            if strict:
+                raise RuntimeError(
+                    f"Cannot remove object id {obj_id} as it doesn't exist. "
+                    f"All existing object ids: {inference_state['obj_ids']}."
+                )
+            return inference_state["obj_ids"]
+        # If this is the only remaining object, we simply reset the whole state
+        if self._get_obj_num(inference_state) == 1:
+            self.reset_state(inference_state)
+            return inference_state["obj_ids"]
+
+        # (the outputs are accessed on CPU below if they're offloaded to CPU)
+        self._sync_offloaded_state(inference_state)
+
+        # Step 1: the frames that only this object has inputs on are no longer input
+        # frames, so we turn their consolidated outputs into regular (non-conditioning)
+        # tracking outputs for the remaining objects
+        point_inputs_per_obj = inference_state["point_inputs_per_obj"]
+        mask_inputs_per_obj = inference_state["mask_inputs_per_obj"]
+        input_frame_inds = set()
+        for obj_idx in point_inputs_per_obj:
+            if obj_idx != old_obj_idx:
+                input_frame_inds.update(point_inputs_per_obj[obj_idx])
+                input_frame_inds.update(mask_inputs_per_obj[obj_idx])
+        obj_input_frame_inds = set(point_inputs_per_obj[old_obj_idx])
+        obj_input_frame_inds.update(mask_inputs_per_obj[old_obj_idx])
+        output_dict = inference_state["output_dict"]
+        output_dict_per_obj = inference_state["output_dict_per_obj"]
+        consolidated_frame_inds = inference_state["consolidated_frame_inds"]
+        for frame_idx in obj_input_frame_inds - input_frame_inds:
+            consolidated_frame_inds["cond_frame_outputs"].discard(frame_idx)
+            consolidated_frame_inds["non_cond_frame_outputs"].discard(frame_idx)
+            out = output_dict["cond_frame_outputs"].pop(frame_idx, None)
+            if out is not None:
+                output_dict["non_cond_frame_outputs"][frame_idx] = out
+                for obj_output_dict in output_dict_per_obj.values():
+                    if frame_idx in obj_output_dict["cond_frame_outputs"]:
+                        del obj_output_dict["cond_frame_outputs"][frame_idx]
+                        obj_output_dict["non_cond_frame_outputs"].link(frame_idx)
+
+        # Step 2: remove this object's slot from the multi-object outputs
+        def _remove_slot(x):
+            return cat_tensors([x[:old_obj_idx], x[old_obj_idx + 1 :]])
+
+        batch_size = self._get_obj_num(inference_state) - 1
+        for storage_key in ["cond_frame_outputs", "non_cond_frame_outputs"]:
+            for out in output_dict[storage_key].values():
+                out["pred_masks"] = _remove_slot(out["pred_masks"])
+                out["obj_ptr"] = _remove_slot(out["obj_ptr"])
+                if out["maskmem_features"] is not None:
+                    out["maskmem_features"] = _remove_slot(out["maskmem_features"])
+                    out["maskmem_pos_enc"] = self._expand_maskmem_pos_enc(
+                        inference_state, batch_size=batch_size
+                    )
+
+        # Step 3: remap the remaining objects to the new object indices (which their
+        # per-object views of the multi-object outputs then slice)
+        old_obj_ids = inference_state["obj_ids"]
+        new_obj_ids = [i for i in old_obj_ids if i != obj_id]
+        old_obj_inds = [inference_state["obj_id_to_idx"][i] for i in new_obj_ids]
+        per_obj_keys = [
+            "point_inputs_per_obj",
+            "mask_inputs_per_obj",
+            "output_dict_per_obj",
+            "temp_output_dict_per_obj",
+        ]
+        for key in per_obj_keys:
+            per_obj = inference_state[key]
+            remapped = [per_obj[old_idx] for old_idx in old_obj_inds]
+            per_obj.clear()
+            per_obj.update(enumerate(remapped))
+        inference_state["obj_id_to_idx"].clear()
+        inference_state["obj_idx_to_id"].clear()
+        for new_obj_idx, new_obj_id in enumerate(new_obj_ids):
+            inference_state["obj_id_to_idx"][new_obj_id] = new_obj_idx
+            inference_state["obj_idx_to_id"][new_obj_idx] = new_obj_id
+        inference_state["obj_ids"] = new_obj_ids
+        for dirty_obj_ids in inference_state["dirty_obj_ids"].values():
+            dirty_obj_ids.discard(obj_id)
+        inference_state["interactive_video_res_masks"] = None
+        for obj_idx, obj_output_dict in output_dict_per_obj.items():
+            for obj_outputs in obj_output_dict.values():
+                obj_outputs.obj_idx = obj_idx
+        return inference_state["obj_ids"]
+
     def _reset_tracking_results(self, inference_state):
         """Reset all tracking inputs and results across the videos."""
         for v in inference_state["point_inputs_per_obj"].values():
@@ -787,21 +2170,497 @@ class SAM2VideoPredictor(SAM2Base):
         inference_state["consolidated_frame_inds"]["non_cond_frame_outputs"].clear()
         inference_state["tracking_has_started"] = False
         inference_state["frames_already_tracked"].clear()
+        for dirty_obj_ids in inference_state["dirty_obj_ids"].values():
+            dirty_obj_ids.clear()
+        inference_state["empty_mask_memory"].clear()
+        inference_state["interactive_video_res_masks"] = None
+        if inference_state["pinned_memory_pool"] is not None:
+            inference_state["pinned_memory_pool"].clear()
+
+    @torch.inference_mode()
+    def save_state(self, inference_state, path, compress=False):
+        """
+        Save the inputs and tracking results in an inference state into a file (an
+        ".npz" archive of numpy arrays along with a JSON metadata entry, so no tensors
+        are pickled), which can be restored via `load_state` into a new session on the
+        same video (e.g. after a worker restarts or on another host). The video frames
+        and image features are not saved, as they are re-loaded in the new session.
+        """
+        self._sync_offloaded_state(inference_state)
+        arrays = {}
+
+        def _pack_stored(x):
+            # quantized tensors are saved as their int8 values and scales
+            if isinstance(x, QuantizedTensor):
+                return {
+                    "data": pack_tensor(arrays, x.data),
+                    "scale": pack_tensor(arrays, x.scale),
+                    "dtype": str(x.dtype).replace("torch.", ""),
+                    "clamp": x.clamp,
+                }
+            return pack_tensor(arrays, x)
+
+        def _pack_out(out):
+            # "maskmem_pos_enc" is a constant in the state (see `_get_maskmem_pos_enc`)
+            maskmem_features = out["maskmem_features"]
+            return {
+                "maskmem_features": (
+                    None if maskmem_features is None else _pack_stored(maskmem_features)
+                ),
+                "pred_masks": _pack_stored(out["pred_masks"]),
+                "obj_ptr": pack_tensor(arrays, out["obj_ptr"]),
+            }
+
+        def _pack_output_dict(output_dict):
+            return {
+                storage_key: [[t, _pack_out(out)] for t, out in outputs.items()]
+                for storage_key, outputs in output_dict.items()
+            }
+
+        num_objs = self._get_obj_num(inference_state)
+        point_inputs_per_obj = inference_state["point_inputs_per_obj"]
+        mask_inputs_per_obj = inference_state["mask_inputs_per_obj"]
+        temp_output_dict_per_obj = inference_state["temp_output_dict_per_obj"]
+        maskmem_pos_enc = inference_state["constants"].get("maskmem_pos_enc", None)
+        meta = {
+            "version": STATE_FILE_VERSION,
+            "num_frames": inference_state["num_frames"],
+            "video_height": inference_state["video_height"],
+            "video_width": inference_state["video_width"],
+            "obj_ids": inference_state["obj_ids"],
+            "point_inputs_per_obj": [
+                [
+                    [t, {k: pack_tensor(arrays, v) for k, v in point_inputs.items()}]
+                    for t, point_inputs in point_inputs_per_obj[obj_idx].items()
+                ]
+                for obj_idx in range(num_objs)
+            ],
+            "mask_inputs_per_obj": [
+                [
+                    [t, pack_tensor(arrays, mask_inputs)]
+                    for t, mask_inputs in mask_inputs_per_obj[obj_idx].items()
+                ]
+                for obj_idx in range(num_objs)
+            ],
+            "output_dict": _pack_output_dict(inference_state["output_dict"]),
+            # the frames in each object's slices of "output_dict" (which could be only
+            # a subset of frames for objects added after the tracking starts)
+            "output_frame_inds_per_obj": [
+                {
+                    storage_key: sorted(obj_outputs)
+                    for storage_key, obj_outputs in inference_state[
+                        "output_dict_per_obj"
+                    ][obj_idx].items()
+                }
+                for obj_idx in range(num_objs)
+            ],
+            "temp_output_dict_per_obj": [
+                _pack_output_dict(temp_output_dict_per_obj[obj_idx])
+                for obj_idx in range(num_objs)
+            ],
+            "consolidated_frame_inds": {
+                storage_key: sorted(frame_inds)
+                for storage_key, frame_inds in inference_state[
+                    "consolidated_frame_inds"
+                ].items()
+            },
+            "maskmem_pos_enc": (
+                None
+                if maskmem_pos_enc is None
+                else [pack_tensor(arrays, x) for x in maskmem_pos_enc]
+            ),
+            "tracking_has_started": inference_state["tracking_has_started"],
+            "frames_already_tracked": [
+                [t, v["reverse"]]
+                for t, v in inference_state["frames_already_tracked"].items()
+            ],
+            # the objects to be re-tracked in the forward and backward directions
+            "dirty_obj_ids": {
+                direction: [
+                    obj_id
+                    for obj_id in inference_state["obj_ids"]
+                    if obj_id in inference_state["dirty_obj_ids"][reverse]
+                ]
+                for direction, reverse in [("forward", False), ("backward", True)]
+            },
+        }
+        meta_bytes = np.frombuffer(json.dumps(meta).encode("utf-8"), dtype=np.uint8)
+        savez = np.savez_compressed if compress else np.savez
+        with open(path, "wb") as f:
+            savez(f, meta=meta_bytes, **arrays)
+
+    @torch.inference_mode()
+    def load_state(self, inference_state, path):
+        """
+        Restore the inputs and tracking results saved via `save_state` into an inference
+        state on the same video (replacing any existing inputs and results in it).
+        """
+        with np.load(path, allow_pickle=False) as data:
+            arrays = dict(data.items())
+        meta = json.loads(arrays.pop("meta").tobytes().decode("utf-8"))
+        if meta["version"] > STATE_FILE_VERSION:
+            raise RuntimeError(
+                f"Unsupported state file version {meta['version']} in {path} (the "
+                f"latest supported version is {STATE_FILE_VERSION})"
+            )
+        for key in ["num_frames", "video_height", "video_width"]:
+            if meta[key] != inference_state[key]:
+                raise RuntimeError(
+                    f"The state in {path} has {key}={meta[key]}, but the current "
+                    f"session has {key}={inference_state[key]}; please load the "
+                    "state into a session on the same video"
+                )
+
+        device = inference_state["device"]
+        storage_device = inference_state["storage_device"]
+        self.reset_state(inference_state)
+        for obj_id in meta["obj_ids"]:
+            self._obj_id_to_idx(inference_state, obj_id)
+        constants = inference_state["constants"]
+        if meta["maskmem_pos_enc"] is not None:
+            constants["maskmem_pos_enc"] = [
+                unpack_tensor(arrays, ref, device) for ref in meta["maskmem_pos_enc"]
+            ]
+
+        def _unpack_stored(ref):
+            if "scale" in ref:  # (a quantized tensor)
+                return QuantizedTensor(
+                    data=unpack_tensor(arrays, ref["data"], storage_device),
+                    scale=unpack_tensor(arrays, ref["scale"], storage_device),
+                    dtype=getattr(torch, ref["dtype"]),
+                    clamp=ref["clamp"],
+                )
+            return unpack_tensor(arrays, ref, storage_device)
 
-    def _get_image_feature(self, inference_state, frame_idx, batch_size):
-        """Compute the image features on a given frame."""
-        # Look up in the cache first
-        image, backbone_out = inference_state["cached_features"].get(
-            frame_idx, (None, None)
+        def _unpack_out(out_ref):
+            # the outputs are converted into the storage format of the current session
+            pred_masks = dequantize(
+                _unpack_stored(out_ref["pred_masks"]), dtype=torch.float32
+            )
+            out = {
+                "maskmem_features": None,
+                "maskmem_pos_enc": None,
+                "pred_masks": self._get_stored_pred_masks(inference_state, pred_masks),
+                "obj_ptr": unpack_tensor(arrays, out_ref["obj_ptr"], device),
+            }
+            if out_ref["maskmem_features"] is not None:
+                maskmem_features = dequantize(
+                    _unpack_stored(out_ref["maskmem_features"])
+                )
+                out["maskmem_features"] = self._get_stored_maskmem_features(
+                    inference_state, maskmem_features
+                )
+                batch_size = out["maskmem_features"].size(0)
+                out["maskmem_pos_enc"] = [
+                    x.expand(batch_size, -1, -1, -1)
+                    for x in constants["maskmem_pos_enc"]
+                ]
+            return out
+
+        def _unpack_output_dict(output_dict, output_dict_ref):
+            for storage_key, outputs in output_dict_ref.items():
+                for t, out_ref in outputs:
+                    output_dict[storage_key][t] = _unpack_out(out_ref)
+
+        for obj_idx in range(len(meta["obj_ids"])):
+            point_inputs_per_frame = inference_state["point_inputs_per_obj"][obj_idx]
+            for t, point_inputs in meta["point_inputs_per_obj"][obj_idx]:
+                point_inputs_per_frame[t] = {
+                    k: unpack_tensor(arrays, ref, device)
+                    for k, ref in point_inputs.items()
+                }
+            mask_inputs_per_frame = inference_state["mask_inputs_per_obj"][obj_idx]
+            for t, ref in meta["mask_inputs_per_obj"][obj_idx]:
+                mask_inputs_per_frame[t] = unpack_tensor(arrays, ref, device)
+            _unpack_output_dict(
+                inference_state["temp_output_dict_per_obj"][obj_idx],
+                meta["temp_output_dict_per_obj"][obj_idx],
+            )
+        output_dict = inference_state["output_dict"]
+        _unpack_output_dict(output_dict, meta["output_dict"])
+        # re-create the per-object views of the outputs
+        if "output_frame_inds_per_obj" in meta:
+            for obj_idx, frame_inds in enumerate(meta["output_frame_inds_per_obj"]):
+                obj_output_dict = inference_state["output_dict_per_obj"][obj_idx]
+                for storage_key, obj_frame_inds in frame_inds.items():
+                    for t in obj_frame_inds:
+                        obj_output_dict[storage_key].link(t)
+        else:  # (version 1 files, where all objects have all frames)
+            for storage_key in ["cond_frame_outputs", "non_cond_frame_outputs"]:
+                for t, out in output_dict[storage_key].items():
+                    self._add_output_per_object(inference_state, t, out, storage_key)
+        for storage_key, frame_inds in meta["consolidated_frame_inds"].items():
+            inference_state["consolidated_frame_inds"][storage_key].update(frame_inds)
+        inference_state["tracking_has_started"] = meta["tracking_has_started"]
+        for t, reverse in meta["frames_already_tracked"]:
+            inference_state["frames_already_tracked"][t] = {"reverse": reverse}
+        if "dirty_obj_ids" in meta:
+            for direction, reverse in [("forward", False), ("backward", True)]:
+                dirty_obj_ids = meta["dirty_obj_ids"][direction]
+                inference_state["dirty_obj_ids"][reverse].update(dirty_obj_ids)
+        elif meta["tracking_has_started"]:
+            # (files before version 4, where we re-track all the objects to be safe)
+            for dirty_obj_ids in inference_state["dirty_obj_ids"].values():
+                dirty_obj_ids.update(meta["obj_ids"])
+
+    def _get_frame_image(self, inference_state, frame_idx):
+        """Get the input image on a frame as a [1, 3, H, W] tensor on compute device."""
+        device = inference_state["device"]
+        image = inference_state["images"][frame_idx].to(device, non_blocking=True)
+        if image.dtype == torch.uint8:
+            image = normalize_uint8_image(
+                image, inference_state["img_mean"], inference_state["img_std"]
+            )
+        return image.float().unsqueeze(0)
+
+    def _compute_image_features(self, inference_state, frame_inds, images=None):
+        """
+        Compute the image features on multiple frames in a single batched forward pass
+        of the image encoder. It returns a dict of {frame_idx: (image, backbone_out)}.
+        """
+        if len(frame_inds) == 0:
+            return {}
+        if images is None:
+            images = [self._get_frame_image(inference_state, t) for t in frame_inds]
+        images = torch.cat(images, dim=0)
+        backbone_out = self.forward_image(images)
+        features = {}
+        for i, frame_idx in enumerate(frame_inds):
+            frame_slice = slice(i, i + 1)
+            frame_backbone_out = {
+                key: [x[frame_slice] for x in backbone_out[key]]
+                for key in ["backbone_fpn", "vision_pos_enc"]
+            }
+            features[frame_idx] = (images[frame_slice], frame_backbone_out)
+        return features
+
+    def _prefetch_frame_features(
+        self, inference_state, frame_inds, prefetch_batch_size, pipeline_depth
+    ):
+        """
+        Start computing the image features on `frame_inds` ahead of tracking (if either
+        `prefetch_batch_size > 1` or `pipeline_depth > 0`; see `_iter_frame_features`),
+        skipping those frames whose features are already in the feature store. It
+        returns the feature iterator and the set of frames it yields.
+        """
+        if prefetch_batch_size <= 1 and pipeline_depth <= 0:
+            return None, set()
+        feature_store = inference_state["feature_store"]
+        if feature_store is not None:
+            frame_inds = [t for t in frame_inds if t not in feature_store]
+        frame_features = self._iter_frame_features(
+            inference_state,
+            frame_inds,
+            prefetch_batch_size=prefetch_batch_size,
+            pipeline_depth=pipeline_depth,
         )
-        if backbone_out is None:
-            # Cache miss -- we will run inference on a single image
-            device = inference_state["device"]
-            image = inference_state["images"][frame_idx].to(device).float().unsqueeze(0)
-            backbone_out = self.forward_image(image)
-            # Cache the most recent frame's feature (for repeated interactions with
-            # a frame; we can use an LRU cache for more frames in the future).
-            inference_state["cached_features"] = {frame_idx: (image, backbone_out)}
+        return frame_features, set(frame_inds)
+
+    def _put_prefetched_features(self, inference_state, frame_idx, frame_features):
+        """
+        Put the next prefetched features (on `frame_idx`) into the feature cache (to
+        keep them for later lookups) and return them to track this frame on.
+        """
+        feat_frame_idx, features = next(frame_features)
+        assert feat_frame_idx == frame_idx
+        inference_state["cached_features"].put(frame_idx, *features)
+        feature_store = inference_state["feature_store"]
+        if feature_store is not None:
+            feature_store.put(frame_idx, features[1])
+        return features
+
+    def _iter_frame_features(
+        self, inference_state, frame_inds, prefetch_batch_size, pipeline_depth
+    ):
+        """
+        Compute the image features on `frame_inds` ahead of tracking in batches of up
+        to `prefetch_batch_size` frames. It yields (frame_idx, (image, backbone_out))
+        in the same order as `frame_inds`.
+
+        If `pipeline_depth > 0`, frame decoding and the image encoder run in two
+        background threads connected by bounded queues (of size `pipeline_depth`), so
+        that they overlap with the tracking of previous frames in the main thread.
+        """
+        prefetch_batch_size = max(prefetch_batch_size, 1)
+        if pipeline_depth <= 0:
+            for i in range(0, len(frame_inds), prefetch_batch_size):
+                batch_frame_inds = frame_inds[i : i + prefetch_batch_size]
+                features = self._compute_image_features(
+                    inference_state, batch_frame_inds
+                )
+                yield from features.items()
+            return
+
+        stop_event = threading.Event()
+        decoded_queue = queue.Queue(maxsize=pipeline_depth)
+        encoded_queue = queue.Queue(maxsize=pipeline_depth)
+        # the inference mode and autocast states are thread-local, so we replicate
+        # the caller's states in the worker threads
+        autocast_kwargs = get_autocast_kwargs(inference_state["device"])
+
+        def _put(q, item):
+            # wait until there is a free slot in the queue or the pipeline is stopped
+            while not stop_event.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def _get(q):
+            # wait until there is an item in the queue or the pipeline is stopped
+            while not stop_event.is_set():
+                try:
+                    return q.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            return None
+
+        def _decode_frames():
+            try:
+                with torch.inference_mode():
+                    for frame_idx in frame_inds:
+                        image = self._get_frame_image(inference_state, frame_idx)
+                        if not _put(decoded_queue, (frame_idx, image)):
+                            return
+                _put(decoded_queue, None)  # end of the frames
+            except Exception as e:
+                _put(decoded_queue, e)
+
+        def _encode_frames():
+            try:
+                with torch.inference_mode(), torch.autocast(**autocast_kwargs):
+                    is_done = False
+                    while not is_done:
+                        batch_frame_inds, batch_images = [], []
+                        while len(batch_frame_inds) < prefetch_batch_size:
+                            item = _get(decoded_queue)
+                            if isinstance(item, Exception):
+                                raise item
+                            if item is None:
+                                is_done = True
+                                break
+                            batch_frame_inds.append(item[0])
+                            batch_images.append(item[1])
+                        features = self._compute_image_features(
+                            inference_state, batch_frame_inds, batch_images
+                        )
+                        for item in features.items():
+                            if not _put(encoded_queue, item):
+                                return
+                _put(encoded_queue, None)  # end of the frames
+            except Exception as e:
+                _put(encoded_queue, e)
+
+        threads = [
+            threading.Thread(target=_decode_frames, daemon=True),
+            threading.Thread(target=_encode_frames, daemon=True),
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                item = encoded_queue.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise RuntimeError("Failure in the propagation pipeline") from item
+                yield item
+        finally:
+            stop_event.set()
+
+    def _get_feature_store_key(self, video_path):
+        """
+        Get the key of a video in the feature store, which identifies both the video
+        frames (including the image size) and the weights of the image encoder.
+        """
+        if self._image_encoder_digest is None:
+            # the backbone features also include the high-resolution feature projections
+            # in the SAM mask decoder (see `forward_image`)
+            modules = [self.image_encoder]
+            if self.use_high_res_features_in_sam:
+                decoder = self.sam_mask_decoder
+                modules += [decoder.conv_s0, decoder.conv_s1]
+            digest = hashlib.sha1()
+            for module in modules:
+                for name, x in module.state_dict().items():
+                    digest.update(name.encode("utf-8"))
+                    x = x.detach().flatten().contiguous().view(torch.uint8)
+                    digest.update(x.cpu().numpy().tobytes())
+            self._image_encoder_digest = digest.hexdigest()
+        video_key = get_video_cache_key(video_path, self.image_size)
+        return f"{video_key}_{self._image_encoder_digest[:16]}"
+
+    @torch.inference_mode()
+    def populate_feature_store(self, inference_state, batch_size=16):
+        """
+        Compute the image features on all frames that are not in the feature store yet
+        in batches of `batch_size` frames and write them into the store (e.g. in a batch
+        job ahead of the interactive sessions or evaluation runs on the same video).
+        """
+        feature_store = inference_state["feature_store"]
+        if feature_store is None:
+            raise RuntimeError(
+                "No feature store in this session; please set `feature_store_dir` in "
+                "`init_state` first"
+            )
+        num_frames = inference_state["num_frames"]
+        frame_inds = [t for t in range(num_frames) if t not in feature_store]
+        for i in tqdm(
+            range(0, len(frame_inds), batch_size), desc="populate feature store"
+        ):
+            batch_frame_inds = frame_inds[i : i + batch_size]
+            features = self._compute_image_features(inference_state, batch_frame_inds)
+            for frame_idx, (_, backbone_out) in features.items():
+                feature_store.put(frame_idx, backbone_out)
+        feature_store.flush()
+
+    def _get_image_feature_dtype(self, inference_state):
+        """
+        Get the dtype of the image features computed by `forward_image` in the current
+        context, i.e. the autocast dtype if autocast is enabled (as in our inference
+        scripts), or otherwise the dtype of the image encoder weights.
+        """
+        autocast_kwargs = get_autocast_kwargs(inference_state["device"])
+        if autocast_kwargs["enabled"]:
+            return autocast_kwargs["dtype"]
+        return next(self.image_encoder.parameters()).dtype
+
+    def _get_image_feature(
+        self, inference_state, frame_idx, batch_size, frame_features=None
+    ):
+        """
+        Compute the image features on a given frame, or use `frame_features` if given,
+        i.e. the (image, backbone_out) just computed on this frame (e.g. prefetched),
+        instead of reading them back from the feature cache (which may hold them in a
+        lower precision).
+        """
+        if frame_features is not None:
+            image, backbone_out = frame_features
+        else:
+            # Look up in the cache first
+            image, backbone_out = inference_state["cached_features"].get(
+                frame_idx, (None, None)
+            )
+            if backbone_out is None:
+                image = self._get_frame_image(inference_state, frame_idx)
+                # Then look up in the on-disk feature store (if any)
+                feature_store = inference_state["feature_store"]
+                if feature_store is not None:
+                    backbone_out = feature_store.get(
+                        frame_idx,
+                        inference_state["device"],
+                        self._get_image_feature_dtype(inference_state),
+                    )
+                if backbone_out is None:
+                    # Cache miss -- we will run inference on a single image
+                    backbone_out = self.forward_image(image)
+                    if feature_store is not None:
+                        feature_store.put(frame_idx, backbone_out)
+                # Cache the recent frames' features (for repeated interactions with a
+                # frame or jumping between a few frames)
+                inference_state["cached_features"].put(frame_idx, image, backbone_out)
 
         # expand the features to have the same dimension as the number of objects
         expanded_image = image.expand(batch_size, -1, -1, -1)
@@ -833,6 +2692,8 @@ class SAM2VideoPredictor(SAM2Base):
         reverse,
         run_mem_encoder,
         prev_sam_mask_logits=None,
+        frame_stride=1,
+        frame_features=None,
     ):
         """Run tracking on a single frame based on current inputs and previous memory."""
         # Retrieve correct image features
@@ -842,12 +2703,17 @@ class SAM2VideoPredictor(SAM2Base):
             current_vision_feats,
             current_vision_pos_embeds,
             feat_sizes,
-        ) = self._get_image_feature(inference_state, frame_idx, batch_size)
+        ) = self._get_image_feature(
+            inference_state, frame_idx, batch_size, frame_features
+        )
 
         # point and mask should not appear as input simultaneously on the same frame
         assert point_inputs is None or mask_inputs is None
+        track_frame_idx, output_dict, num_frames = self._get_strided_timeline(
+            inference_state, output_dict, frame_idx, frame_stride
+        )
         current_out = self.track_step(
-            frame_idx=frame_idx,
+            frame_idx=track_frame_idx,
             is_init_cond_frame=is_init_cond_frame,
             current_vision_feats=current_vision_feats,
             current_vision_pos_embeds=current_vision_pos_embeds,
@@ -855,25 +2721,154 @@ class SAM2VideoPredictor(SAM2Base):
             point_inputs=point_inputs,
             mask_inputs=mask_inputs,
             output_dict=output_dict,
-            num_frames=inference_state["num_frames"],
+            num_frames=num_frames,
             track_in_reverse=reverse,
             run_mem_encoder=run_mem_encoder,
             prev_sam_mask_logits=prev_sam_mask_logits,
         )
 
+        return self._compact_frame_output(inference_state, current_out)
+
+    def _get_strided_timeline(
+        self, inference_state, output_dict, frame_idx, frame_stride
+    ):
+        """
+        Get the index of `frame_idx`, the view of `output_dict` and the number of frames
+        on the timeline of every `frame_stride`-th frame aligned with `frame_idx` (see
+        `StridedFrameOutputs`), so that only these frames are tracked as if they were
+        consecutive frames (e.g. on the memory frames every `num_maskmem` of them).
+        """
+        num_frames = inference_state["num_frames"]
+        if frame_stride <= 1:
+            return frame_idx, output_dict, num_frames
+        offset = frame_idx % frame_stride
+        strided_output_dict = {
+            storage_key: StridedFrameOutputs(frame_outputs, offset, frame_stride)
+            for storage_key, frame_outputs in output_dict.items()
+        }
+        if num_frames is not None:
+            num_frames = -(-(num_frames - offset) // frame_stride)
+        return frame_idx // frame_stride, strided_output_dict, num_frames
+
+    def _run_frame_inference_in_chunks(
+        self,
+        inference_state,
+        frame_idx,
+        batch_size,
+        obj_chunk_size,
+        reverse,
+        frame_stride=1,
+        frame_features=None,
+    ):
+        """
+        Track all objects on a frame without inputs (as `_run_single_frame_inference`)
+        in chunks of up to `obj_chunk_size` objects. Each chunk attends to the slice of
+        its own objects in the previous outputs, and all chunks use the same image
+        features on this frame (looked up once, instead of once per chunk from the
+        feature cache, which may hold them in a lower precision).
+        """
+        output_dict = inference_state["output_dict"]
+        # (the features of a single object, which are expanded to each chunk below)
+        (
+            _,
+            _,
+            current_vision_feats,
+            current_vision_pos_embeds,
+            feat_sizes,
+        ) = self._get_image_feature(
+            inference_state, frame_idx, batch_size=1, frame_features=frame_features
+        )
+        # The non-overlapping constraints in the memory encoder apply across all the
+        # objects, so in that case we run the memory encoder on all of them at the end.
+        run_mem_encoder = self.num_maskmem > 0
+        mem_encoder_per_chunk = not self.non_overlap_masks_for_mem_enc
+        chunk_outputs, pred_masks_per_chunk, high_res_masks_per_chunk = [], [], []
+        for start in range(0, batch_size, obj_chunk_size):
+            obj_slice = slice(start, min(start + obj_chunk_size, batch_size))
+            chunk_output_dict = {
+                storage_key: SlicedFrameOutputs(output_dict[storage_key], obj_slice)
+                for storage_key in ["cond_frame_outputs", "non_cond_frame_outputs"]
+            }
+            track_frame_idx, chunk_output_dict, num_frames = self._get_strided_timeline(
+                inference_state, chunk_output_dict, frame_idx, frame_stride
+            )
+            chunk_size = obj_slice.stop - obj_slice.start
+            current_out = self.track_step(
+                frame_idx=track_frame_idx,
+                is_init_cond_frame=False,
+                current_vision_feats=[
+                    x.expand(-1, chunk_size, -1) for x in current_vision_feats
+                ],
+                current_vision_pos_embeds=[
+                    x.expand(-1, chunk_size, -1) for x in current_vision_pos_embeds
+                ],
+                feat_sizes=feat_sizes,
+                point_inputs=None,
+                mask_inputs=None,
+                output_dict=chunk_output_dict,
+                num_frames=num_frames,
+                track_in_reverse=reverse,
+                run_mem_encoder=run_mem_encoder and mem_encoder_per_chunk,
+            )
+            if run_mem_encoder and not mem_encoder_per_chunk:
+                high_res_masks_per_chunk.append(current_out["pred_masks_high_res"])
+            chunk_out, pred_masks = self._compact_frame_output(
+                inference_state, current_out
+            )
+            chunk_outputs.append(chunk_out)
+            pred_masks_per_chunk.append(pred_masks)
+
+        # concatenate the outputs of all chunks into the output of all objects
+        self._sync_offloaded_state(inference_state)
+        compact_current_out = {
+            "maskmem_features": None,
+            "maskmem_pos_enc": None,
+            "pred_masks": cat_tensors([out["pred_masks"] for out in chunk_outputs]),
+            "obj_ptr": torch.cat([out["obj_ptr"] for out in chunk_outputs]),
+        }
+        if run_mem_encoder and mem_encoder_per_chunk:
+            compact_current_out["maskmem_features"] = cat_tensors(
+                [out["maskmem_features"] for out in chunk_outputs]
+            )
+            compact_current_out["maskmem_pos_enc"] = self._expand_maskmem_pos_enc(
+                inference_state, batch_size
+            )
+        elif run_mem_encoder:
+            # (on the same image features as the chunks above)
+            maskmem_features, maskmem_pos_enc = self._encode_new_memory(
+                current_vision_feats=[
+                    x.expand(-1, batch_size, -1) for x in current_vision_feats
+                ],
+                feat_sizes=feat_sizes,
+                pred_masks_high_res=torch.cat(high_res_masks_per_chunk),
+                is_mask_from_pts=False,
+            )
+            compact_current_out["maskmem_features"] = self._get_stored_maskmem_features(
+                inference_state, maskmem_features
+            )
+            compact_current_out["maskmem_pos_enc"] = self._get_maskmem_pos_enc(
+                inference_state, {"maskmem_pos_enc": maskmem_pos_enc}
+            )
+        return compact_current_out, torch.cat(pred_masks_per_chunk)
+
+    def _compact_frame_output(self, inference_state, current_out):
+        """
+        Make a compact version of a frame's `track_step` output to store in the session
+        state. It returns the compact output and the predicted masks on GPU.
+        """
         # optionally offload the output to CPU memory to save GPU space
-        storage_device = inference_state["storage_device"]
         maskmem_features = current_out["maskmem_features"]
         if maskmem_features is not None:
-            maskmem_features = maskmem_features.to(torch.bfloat16)
-            maskmem_features = maskmem_features.to(storage_device, non_blocking=True)
+            maskmem_features = self._get_stored_maskmem_features(
+                inference_state, maskmem_features
+            )
         pred_masks_gpu = current_out["pred_masks"]
         # potentially fill holes in the predicted masks
         if self.fill_hole_area > 0:
             pred_masks_gpu = fill_holes_in_mask_scores(
                 pred_masks_gpu, self.fill_hole_area
             )
-        pred_masks = pred_masks_gpu.to(storage_device, non_blocking=True)
+        pred_masks = self._get_stored_pred_masks(inference_state, pred_masks_gpu)
         # "maskmem_pos_enc" is the same across frames, so we only need to store one copy of it
         maskmem_pos_enc = self._get_maskmem_pos_enc(inference_state, current_out)
         # object pointer is a small tensor, so we always keep it on GPU memory for fast access
@@ -887,6 +2882,226 @@ class SAM2VideoPredictor(SAM2Base):
         }
         return compact_current_out, pred_masks_gpu
 
+    def _get_stored_maskmem_features(self, inference_state, maskmem_features):
+        """Convert the memory features into their storage format on storage device."""
+        if inference_state["maskmem_storage_dtype"] == torch.int8:
+            maskmem_features = QuantizedTensor.quantize(
+                maskmem_features, dtype=torch.bfloat16
+            )
+        else:
+            maskmem_features = maskmem_features.to(torch.bfloat16)
+        return self._to_storage_device(inference_state, maskmem_features)
+
+    def _get_stored_pred_masks(self, inference_state, pred_masks):
+        """Convert the mask logits into their storage format on storage device."""
+        storage_dtype = inference_state["pred_masks_storage_dtype"]
+        if storage_dtype == torch.int8:
+            # (the same clamping as on the previous mask logits fed to the SAM decoder)
+            pred_masks = QuantizedTensor.quantize(pred_masks, clamp=32.0)
+        else:
+            pred_masks = pred_masks.to(storage_dtype)
+        return self._to_storage_device(inference_state, pred_masks)
+
+    def _to_storage_device(self, inference_state, x):
+        """Move a (regular or quantized) tensor to the storage device."""
+        pool = inference_state["pinned_memory_pool"]
+        if pool is None or x.device.type != "cuda":
+            return x.to(inference_state["storage_device"], non_blocking=True)
+        if isinstance(x, QuantizedTensor):
+            data, scale = pool.copy_from(x.data), pool.copy_from(x.scale)
+            return QuantizedTensor(data, scale, x.dtype, x.clamp)
+        return pool.copy_from(x)
+
+    def _sync_offloaded_state(self, inference_state):
+        """
+        Wait for the asynchronous copies of the outputs into pinned CPU memory (if any)
+        to finish, before accessing the stored outputs on CPU.
+        """
+        pool = inference_state["pinned_memory_pool"]
+        if pool is not None:
+            pool.synchronize()
+
+    def _compute_multi_session_features(self, inference_states, frame_inds):
+        """
+        Compute the image features on one frame of each session in a single batched
+        forward pass of the image encoder, and put them into the feature cache (and the
+        feature store) of each session. The frames whose features are already cached or
+        stored are skipped. It returns the (image, backbone_out) just computed on the
+        frame of each session (or `None` for the skipped frames), to be used directly
+        instead of being read back from the feature cache.
+        """
+        frames_to_compute = []
+        for session_idx, (inference_state, frame_idx) in enumerate(
+            zip(inference_states, frame_inds)
+        ):
+            feature_store = inference_state["feature_store"]
+            if frame_idx in inference_state["cached_features"] or (
+                feature_store is not None and frame_idx in feature_store
+            ):
+                continue
+            frames_to_compute.append((session_idx, inference_state, frame_idx))
+        # the features are keyed by their position in the batch (instead of frame index)
+        images = [self._get_frame_image(s, t) for _, s, t in frames_to_compute]
+        features = self._compute_image_features(
+            None, list(range(len(images))), images=images
+        )
+        computed_features = [None] * len(inference_states)
+        for i, (session_idx, inference_state, frame_idx) in enumerate(
+            frames_to_compute
+        ):
+            inference_state["cached_features"].put(frame_idx, *features[i])
+            feature_store = inference_state["feature_store"]
+            if feature_store is not None:
+                feature_store.put(frame_idx, features[i][1])
+            computed_features[session_idx] = features[i]
+        return computed_features
+
+    def _run_multi_session_inference(self, inference_states, frame_inds, reverse):
+        """
+        Track all objects of several sessions on one frame each (without any inputs on
+        them) in a batched forward pass, which concatenates the objects of all sessions
+        along the batch dimension. It returns the (compact_current_out, pred_masks_gpu)
+        of each session, as `_run_single_frame_inference` does for a single session.
+        """
+        if len(inference_states) == 0:
+            return []
+        frame_features_per_session = self._compute_multi_session_features(
+            inference_states, frame_inds
+        )
+        batch_sizes = [self._get_obj_num(s) for s in inference_states]
+        vision_feats_per_session, vision_pos_embeds_per_session = [], []
+        for inference_state, frame_idx, batch_size, frame_features in zip(
+            inference_states, frame_inds, batch_sizes, frame_features_per_session
+        ):
+            (
+                _,
+                _,
+                current_vision_feats,
+                current_vision_pos_embeds,
+                feat_sizes,
+            ) = self._get_image_feature(
+                inference_state, frame_idx, batch_size, frame_features
+            )
+            vision_feats_per_session.append(current_vision_feats)
+            vision_pos_embeds_per_session.append(current_vision_pos_embeds)
+        # concatenate the (HW)BC features of all sessions along the batch dimension
+        current_vision_feats = [
+            torch.cat(feats, dim=1) for feats in zip(*vision_feats_per_session)
+        ]
+        C = self.hidden_dim
+        H, W = feat_sizes[-1]  # top-level (lowest-resolution) feature size
+
+        # Fuse the top-level features of each session with its own memory. Sessions with
+        # the same number of memory tokens (and object pointer tokens) are concatenated
+        # into one batch through the memory attention.
+        if self.num_maskmem == 0:  # Disable memory and skip fusion
+            pix_feat_with_mem = current_vision_feats[-1].permute(1, 2, 0)
+            pix_feat_with_mem = pix_feat_with_mem.view(-1, C, H, W)
+        else:
+            memory_groups = {}
+            for session_idx, (inference_state, frame_idx) in enumerate(
+                zip(inference_states, frame_inds)
+            ):
+                memory, memory_pos_embed, num_obj_ptr_tokens = self._gather_memory(
+                    frame_idx=frame_idx,
+                    is_init_cond_frame=False,
+                    batch_size=batch_sizes[session_idx],
+                    device=inference_state["device"],
+                    output_dict=inference_state["output_dict"],
+                    num_frames=inference_state["num_frames"],
+                    track_in_reverse=reverse,
+                )
+                group_key = (memory.size(0), num_obj_ptr_tokens)
+                memory_groups.setdefault(group_key, []).append(
+                    (session_idx, memory, memory_pos_embed)
+                )
+            pix_feat_per_session = [None] * len(inference_states)
+            for (_, num_obj_ptr_tokens), group in memory_groups.items():
+                session_inds, memory, memory_pos_embed = zip(*group)
+                curr = [vision_feats_per_session[i][-1] for i in session_inds]
+                curr_pos = [vision_pos_embeds_per_session[i][-1] for i in session_inds]
+                pix_feat = self.memory_attention(
+                    curr=[torch.cat(curr, dim=1)],
+                    curr_pos=[torch.cat(curr_pos, dim=1)],
+                    memory=torch.cat(memory, dim=1),
+                    memory_pos=torch.cat(memory_pos_embed, dim=1),
+                    num_obj_ptr_tokens=num_obj_ptr_tokens,
+                )
+                # reshape the output (HW)BC => BCHW and split it back into sessions
+                pix_feat = pix_feat.permute(1, 2, 0).view(-1, C, H, W)
+                group_batch_sizes = [batch_sizes[i] for i in session_inds]
+                for i, x in zip(session_inds, pix_feat.split(group_batch_sizes)):
+                    pix_feat_per_session[i] = x
+            pix_feat_with_mem = torch.cat(pix_feat_per_session, dim=0)
+
+        # apply SAM-style segmentation head on all the objects together
+        if len(current_vision_feats) > 1:
+            high_res_features = [
+                x.permute(1, 2, 0).view(x.size(1), x.size(2), *s)
+                for x, s in zip(current_vision_feats[:-1], feat_sizes[:-1])
+            ]
+        else:
+            high_res_features = None
+        (
+            _,
+            _,
+            _,
+            low_res_masks,
+            high_res_masks,
+            obj_ptr,
+            _,
+        ) = self._forward_sam_heads(
+            backbone_features=pix_feat_with_mem,
+            point_inputs=None,
+            mask_inputs=None,
+            high_res_features=high_res_features,
+            multimask_output=self._use_multimask(False, None),
+        )
+
+        # Encode the new memory. The non-overlapping constraints (if any) apply across
+        # the objects of the same video, so in that case we encode each session apart.
+        if self.num_maskmem == 0:
+            maskmem_features = [None] * len(inference_states)
+            maskmem_pos_enc = [None] * len(inference_states)
+        elif self.non_overlap_masks_for_mem_enc:
+            maskmem_features, maskmem_pos_enc = [], []
+            high_res_masks_per_session = high_res_masks.split(batch_sizes)
+            for session_feats, session_masks in zip(
+                vision_feats_per_session, high_res_masks_per_session
+            ):
+                features, pos_enc = self._encode_new_memory(
+                    current_vision_feats=session_feats,
+                    feat_sizes=feat_sizes,
+                    pred_masks_high_res=session_masks,
+                    is_mask_from_pts=False,
+                )
+                maskmem_features.append(features)
+                maskmem_pos_enc.append(pos_enc)
+        else:
+            features, pos_enc = self._encode_new_memory(
+                current_vision_feats=current_vision_feats,
+                feat_sizes=feat_sizes,
+                pred_masks_high_res=high_res_masks,
+                is_mask_from_pts=False,
+            )
+            maskmem_features = features.split(batch_sizes)
+            pos_enc_per_level = [x.split(batch_sizes) for x in pos_enc]
+            maskmem_pos_enc = [list(x) for x in zip(*pos_enc_per_level)]
+
+        # split the outputs back into sessions
+        outputs = []
+        low_res_masks = low_res_masks.split(batch_sizes)
+        obj_ptr = obj_ptr.split(batch_sizes)
+        for session_idx, inference_state in enumerate(inference_states):
+            current_out = {
+                "pred_masks": low_res_masks[session_idx],
+                "obj_ptr": obj_ptr[session_idx],
+                "maskmem_features": maskmem_features[session_idx],
+                "maskmem_pos_enc": maskmem_pos_enc[session_idx],
+            }
+            outputs.append(self._compact_frame_output(inference_state, current_out))
+        return outputs
+
     def _run_memory_encoder(
         self, inference_state, frame_idx, batch_size, high_res_masks, is_mask_from_pts
     ):
@@ -907,9 +3122,9 @@ class SAM2VideoPredictor(SAM2Base):
         )
 
         # optionally offload the output to CPU memory to save GPU space
-        storage_device = inference_state["storage_device"]
-        maskmem_features = maskmem_features.to(torch.bfloat16)
-        maskmem_features = maskmem_features.to(storage_device, non_blocking=True)
+        maskmem_features = self._get_stored_maskmem_features(
+            inference_state, maskmem_features
+        )
         # "maskmem_pos_enc" is the same across frames, so we only need to store one copy of it
         maskmem_pos_enc = self._get_maskmem_pos_enc(
             inference_state, {"maskmem_pos_enc": maskmem_pos_enc}
@@ -941,6 +3156,65 @@ class SAM2VideoPredictor(SAM2Base):
             expanded_maskmem_pos_enc = None
         return expanded_maskmem_pos_enc
 
+    def _expand_maskmem_pos_enc(self, inference_state, batch_size):
+        """Expand the cached `maskmem_pos_enc` constant to a batch of objects."""
+        maskmem_pos_enc = inference_state["constants"]["maskmem_pos_enc"]
+        return [x.expand(batch_size, -1, -1, -1) for x in maskmem_pos_enc]
+
+    def _get_memory_horizon(self):
+        """
+        Get the maximum temporal distance between the current frame and any previous
+        non-conditioning frame it can use as memory, i.e. as one of the memory frames
+        (`num_maskmem` frames taken every `memory_temporal_stride_for_eval` frames) or
+        as an object pointer (up to `max_obj_ptrs_in_encoder` frames).
+        """
+        horizon = self.memory_temporal_stride_for_eval * self.num_maskmem
+        if self.use_obj_ptrs_in_encoder:
+            horizon = max(horizon, self.max_obj_ptrs_in_encoder)
+        return horizon
+
+    def _evict_stale_outputs(
+        self, inference_state, frame_idx, reverse, start_frame_idx=None, frame_stride=1
+    ):
+        """
+        Remove the non-conditioning outputs that are too far behind the current frame
+        (in the tracking direction) to be used as memory by any later frame. The outputs
+        on conditioning frames and on frames with inputs are always kept. If given, only
+        the outputs tracked since `start_frame_idx` are removed (so that the outputs on
+        the other side of the start frame, e.g. from tracking in the other direction,
+        are kept). When tracking every `frame_stride`-th frame, the memory horizon spans
+        `frame_stride` times as many frames.
+        """
+        horizon = self._get_memory_horizon() * frame_stride
+        consolidated_frame_inds = inference_state["consolidated_frame_inds"]
+        frame_inds_with_inputs = consolidated_frame_inds["non_cond_frame_outputs"]
+        output_dict = inference_state["output_dict"]
+        non_cond_frame_outputs = output_dict["non_cond_frame_outputs"]
+        stale_frame_inds = [
+            t
+            for t in non_cond_frame_outputs
+            if (t > frame_idx + horizon if reverse else t < frame_idx - horizon)
+            and t not in frame_inds_with_inputs
+            and (
+                start_frame_idx is None
+                or (t <= start_frame_idx if reverse else t >= start_frame_idx)
+            )
+        ]
+        for t in stale_frame_inds:
+            self._remove_non_cond_output(inference_state, t)
+
+    def _remove_non_cond_output(self, inference_state, frame_idx):
+        """
+        Remove the non-conditioning output on a frame (if any), both from "output_dict"
+        and from the per-object views in "output_dict_per_obj".
+        """
+        inference_state["output_dict"]["non_cond_frame_outputs"].pop(frame_idx, None)
+        for obj_output_dict in inference_state["output_dict_per_obj"].values():
+            obj_outputs = obj_output_dict["non_cond_frame_outputs"]
+            obj_outputs.pop(frame_idx, None)
+            # the views must not keep any frames whose outputs no longer exist
+            assert frame_idx not in obj_outputs
+
     def _clear_non_cond_mem_around_input(self, inference_state, frame_idx):
         """
         Remove the non-conditioning memory around the input frame. When users provide
@@ -953,9 +3227,5 @@ class SAM2VideoPredictor(SAM2Base):
         r = self.memory_temporal_stride_for_eval
         frame_idx_begin = frame_idx - r * self.num_maskmem
         frame_idx_end = frame_idx + r * self.num_maskmem
-        output_dict = inference_state["output_dict"]
-        non_cond_frame_outputs = output_dict["non_cond_frame_outputs"]
         for t in range(frame_idx_begin, frame_idx_end + 1):
-            non_cond_frame_outputs.pop(t, None)
-            for obj_output_dict in inference_state["output_dict_per_obj"].values():
-                obj_output_dict["non_cond_frame_outputs"].pop(t, None)
+            self._remove_non_cond_output(inference_state, t)
@@ -0,0 +1,260 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import json
+import os
+import shutil
+from collections import OrderedDict
+
+import numpy as np
+import torch
+
+
+def _tensor_nbytes(x):
+    return x.numel() * x.element_size()
+
+
+class LRUFeatureCache:
+    """
+    A least-recently-used cache of the image backbone features on video frames, keyed
+    by frame index and bounded by a memory budget in bytes.
+
+    Each entry holds the input image and its "backbone_fpn" features. The spatial
+    positional encodings ("vision_pos_enc") only depend on the feature map sizes, so
+    we keep a single shared copy of them instead of one copy per frame.
+    """
+
+    def __init__(self, max_bytes=0, storage_dtype=None, storage_device=None):
+        # The total size of all cached entries is kept under `max_bytes` by evicting
+        # the least recently used frames. The most recently added frame is always kept,
+        # so `max_bytes=0` only caches a single frame.
+        self.max_bytes = max_bytes
+        # Optionally, store the cached features in a lower precision (e.g. bfloat16)
+        # and/or on another device (e.g. CPU) so that more frames fit under the budget.
+        # They are converted back to their original dtype and device upon lookup.
+        self.storage_dtype = storage_dtype
+        self.storage_device = storage_device
+        self.entries = OrderedDict()  # {frame_idx: (image, backbone_fpn, nbytes)}
+        self.vision_pos_enc = None
+        self.num_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _pack(self, x, dtype=None):
+        """Convert a tensor into its storage format (a no-op by default)."""
+        if self.storage_device is None and dtype is None:
+            return x, None
+        orig = (x.dtype, x.device)
+        device = x.device if self.storage_device is None else self.storage_device
+        x = x.to(device, dtype=x.dtype if dtype is None else dtype)
+        return x, orig
+
+    def _unpack(self, packed):
+        x, orig = packed
+        if orig is None:
+            return x
+        dtype, device = orig
+        return x.to(device, dtype=dtype, non_blocking=True)
+
+    def get(self, frame_idx, default=None):
+        """Look up the cached (image, backbone_out) on a frame."""
+        entry = self.entries.get(frame_idx, None)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        self.entries.move_to_end(frame_idx)
+        image, backbone_fpn, _ = entry
+        backbone_out = {
+            "backbone_fpn": [self._unpack(x) for x in backbone_fpn],
+            "vision_pos_enc": self.vision_pos_enc,
+        }
+        return self._unpack(image), backbone_out
+
+    def put(self, frame_idx, image, backbone_out):
+        """Add the image and backbone features on a frame into the cache."""
+        self.pop(frame_idx)
+        pos_enc = [x[0:1] for x in backbone_out["vision_pos_enc"]]
+        if self.vision_pos_enc is None or any(
+            x.shape != y.shape for x, y in zip(self.vision_pos_enc, pos_enc)
+        ):
+            # keep a standalone copy (not a view into a batch of frames)
+            self.vision_pos_enc = [x.clone() for x in pos_enc]
+
+        image = self._pack(image)
+        backbone_fpn = [
+            self._pack(x, dtype=self.storage_dtype)
+            for x in backbone_out["backbone_fpn"]
+        ]
+        nbytes = _tensor_nbytes(image[0])
+        nbytes += sum(_tensor_nbytes(x) for x, _ in backbone_fpn)
+        self.entries[frame_idx] = (image, backbone_fpn, nbytes)
+        self.num_bytes += nbytes
+        self._evict()
+
+    def pop(self, frame_idx):
+        entry = self.entries.pop(frame_idx, None)
+        if entry is not None:
+            self.num_bytes -= entry[2]
+
+    def _evict(self):
+        """Evict the least recently used frames until we are under the budget."""
+        while self.num_bytes > self.max_bytes and len(self.entries) > 1:
+            _, entry = self.entries.popitem(last=False)
+            self.num_bytes -= entry[2]
+
+    def __contains__(self, frame_idx):
+        return frame_idx in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        self.entries.clear()
+        self.vision_pos_enc = None
+        self.num_bytes = 0
+
+    def stats(self):
+        """Get the cache usage and hit/miss counters."""
+        return {
+            "num_frames": len(self.entries),
+            "num_bytes": self.num_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class FeatureStore:
+    """
+    A persistent on-disk store of the image backbone features on all frames of a video,
+    held as memory-mapped arrays in a directory named after `key` under `store_dir`.
+
+    The backbone features only depend on the frame and the image encoder weights, so
+    `key` should identify both (see `SAM2VideoPredictor._get_feature_store_key`). Each
+    "backbone_fpn" level is stored in `storage_dtype` (float16 or bfloat16) as a single
+    [num_frames, C, H, W] array along with a per-frame flag marking the stored frames,
+    while the frame-independent "vision_pos_enc" is stored only once. The features are
+    read back in the dtype of each caller (e.g. under autocast or not), regardless of
+    the session that wrote them. The arrays are created upon the first `put`, so the
+    feature shapes don't need to be known upfront.
+    Several processes can share a store, e.g. a batch job populating it in the
+    background while an interactive session reads from it.
+    """
+
+    def __init__(self, store_dir, key, num_frames, storage_dtype=torch.bfloat16):
+        if storage_dtype not in [torch.float16, torch.bfloat16]:
+            raise ValueError(f"Unsupported feature store dtype: {storage_dtype}")
+        self.store_path = os.path.join(store_dir, key)
+        self.num_frames = num_frames
+        self.storage_dtype = storage_dtype
+        self.valid = None
+        self.backbone_fpn = None
+        self.vision_pos_enc = None
+        self._open()
+
+    def _open(self):
+        """Open the arrays in the store (if it has already been created)."""
+        meta_path = os.path.join(self.store_path, "meta.json")
+        if self.valid is not None or not os.path.exists(meta_path):
+            return
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+        if meta["num_frames"] != self.num_frames:
+            raise RuntimeError(
+                f"Feature store {self.store_path} has {meta['num_frames']} frames, "
+                f"but the video has {self.num_frames} frames"
+            )
+        self.storage_dtype = getattr(torch, meta["storage_dtype"])
+        self.backbone_fpn = [
+            np.load(os.path.join(self.store_path, f"fpn_{i}.npy"), mmap_mode="r+")
+            for i in range(meta["num_levels"])
+        ]
+        self.vision_pos_enc = [
+            torch.from_numpy(np.load(os.path.join(self.store_path, f"pos_{i}.npy")))
+            for i in range(meta["num_levels"])
+        ]
+        # the valid flags are opened last, as they're created last
+        self.valid = np.load(os.path.join(self.store_path, "valid.npy"), mmap_mode="r+")
+
+    def _create(self, backbone_out):
+        """Create the arrays in the store from the features on a frame."""
+        # Write the arrays into a temporary directory and then move it into place, so
+        # that other processes never see a partially created store. If another process
+        # created the store first, we use its arrays instead.
+        tmp_path = f"{self.store_path}.tmp{os.getpid()}"
+        os.makedirs(tmp_path, exist_ok=True)
+        backbone_fpn = backbone_out["backbone_fpn"]
+        for i, x in enumerate(backbone_fpn):
+            shape = (self.num_frames,) + tuple(x.shape[1:])
+            np.lib.format.open_memmap(
+                os.path.join(tmp_path, f"fpn_{i}.npy"),
+                mode="w+",
+                dtype=np.int16,  # the raw bits of float16 or bfloat16 values
+                shape=shape,
+            ).flush()
+        for i, pos in enumerate(backbone_out["vision_pos_enc"]):
+            pos = pos[0:1].float().cpu().numpy()
+            np.save(os.path.join(tmp_path, f"pos_{i}.npy"), pos)
+        valid = np.zeros(self.num_frames, dtype=np.uint8)
+        np.save(os.path.join(tmp_path, "valid.npy"), valid)
+        meta = {
+            "num_frames": self.num_frames,
+            "num_levels": len(backbone_fpn),
+            "storage_dtype": str(self.storage_dtype).replace("torch.", ""),
+        }
+        with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+            json.dump(meta, f)
+        try:
+            os.rename(tmp_path, self.store_path)
+        except OSError:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        self._open()
+
+    def __contains__(self, frame_idx):
+        self._open()
+        return self.valid is not None and bool(self.valid[frame_idx])
+
+    def get(self, frame_idx, device, dtype):
+        """
+        Look up the stored backbone_out on a frame (or `None` if not stored) in `dtype`,
+        i.e. that of the features computed by the caller's image encoder.
+        """
+        if frame_idx not in self:
+            return None
+        backbone_fpn = []
+        for x in self.backbone_fpn:
+            x = torch.from_numpy(np.ascontiguousarray(x[frame_idx : frame_idx + 1]))
+            x = x.view(self.storage_dtype).to(device, non_blocking=True)
+            backbone_fpn.append(x.to(dtype))
+        backbone_out = {
+            "backbone_fpn": backbone_fpn,
+            "vision_pos_enc": [x.to(device, dtype) for x in self.vision_pos_enc],
+        }
+        return backbone_out
+
+    def put(self, frame_idx, backbone_out):
+        """Write the backbone features on a frame into the store."""
+        if self.valid is None:
+            self._open()
+        if self.valid is None:
+            self._create(backbone_out)
+        for dst, x in zip(self.backbone_fpn, backbone_out["backbone_fpn"]):
+            x = x[0:1].to(self.storage_dtype).view(torch.int16).cpu()
+            dst[frame_idx : frame_idx + 1] = x.numpy()
+        # mark this frame as stored only after its features are written
+        self.valid[frame_idx] = 1
+
+    def flush(self):
+        if self.valid is not None:
+            for x in self.backbone_fpn:
+                x.flush()
+            self.valid.flush()
+
+    def num_stored_frames(self):
+        self._open()
+        return 0 if self.valid is None else int(self.valid.sum())
@@ -4,8 +4,14 @@
 # This source code is licensed under the license found in the
 # LICENSE file in the root directory of this source tree.
 
+import hashlib
+import io
+import json
 import os
 import warnings
+from collections import deque, OrderedDict
+from collections.abc import Mapping, MutableMapping
+from concurrent.futures import ThreadPoolExecutor
 from threading import Thread
 
 import numpy as np
@@ -13,6 +19,8 @@ import torch
 from PIL import Image
 from tqdm import tqdm
 
+from sam2.utils.video_reader import VideoReader
+
 
 def get_sdpa_settings():
     if torch.cuda.is_available():
@@ -44,6 +52,20 @@ def get_sdpa_settings():
     return old_gpu, use_flash_attn, math_kernel_on
 
 
+def get_autocast_kwargs(device):
+    """
+    Get the current autocast settings on `device` as kwargs to `torch.autocast` (e.g.
+    to replicate the caller's autocast state in a worker thread, as it's thread-local).
+    """
+    if device.type == "cuda":
+        enabled = torch.is_autocast_enabled()
+        dtype = torch.get_autocast_gpu_dtype()
+    else:
+        enabled = torch.is_autocast_cpu_enabled()
+        dtype = torch.get_autocast_cpu_dtype()
+    return {"device_type": device.type, "dtype": dtype, "enabled": enabled}
+
+
 def get_connected_components(mask):
     """
     Get the connected components (8-connectivity) of binary masks of shape (N, 1, H, W).
@@ -89,18 +111,84 @@ def mask_to_box(masks: torch.Tensor):
     return bbox_coords
 
 
-def _load_img_as_tensor(img_path, image_size):
+def _load_img_as_tensor(img_path, image_size, keep_uint8=False):
+    # `img_path` can also be an already decoded frame (e.g. from a `VideoReader`)
+    if isinstance(img_path, Image.Image):
+        return _pil_img_to_tensor(img_path, image_size, keep_uint8=keep_uint8)
     img_pil = Image.open(img_path)
+    return _pil_img_to_tensor(img_pil, image_size, img_path, keep_uint8=keep_uint8)
+
+
+def _pil_img_to_tensor(img_pil, image_size, img_name="image", keep_uint8=False):
     img_np = np.array(img_pil.convert("RGB").resize((image_size, image_size)))
-    if img_np.dtype == np.uint8:  # np.uint8 is expected for JPEG images
+    if img_np.dtype != np.uint8:  # np.uint8 is expected for JPEG images
+        raise RuntimeError(f"Unknown image dtype: {img_np.dtype} on {img_name}")
+    if not keep_uint8:
         img_np = img_np / 255.0
-    else:
-        raise RuntimeError(f"Unknown image dtype: {img_np.dtype} on {img_path}")
     img = torch.from_numpy(img_np).permute(2, 0, 1)
     video_width, video_height = img_pil.size  # the original video size
     return img, video_height, video_width
 
 
+def _frame_to_pil_img(frame):
+    """
+    Convert a frame from a live stream into a PIL image. The frame can be a PIL image,
+    a HxWx3 RGB uint8 numpy array or tensor, or the bytes of an encoded image file.
+    """
+    if isinstance(frame, Image.Image):
+        return frame
+    if isinstance(frame, (bytes, bytearray)):
+        return Image.open(io.BytesIO(frame))
+    if isinstance(frame, torch.Tensor):
+        frame = frame.cpu().numpy()
+    if isinstance(frame, np.ndarray):
+        if frame.dtype != np.uint8 or frame.ndim != 3 or frame.shape[-1] != 3:
+            raise RuntimeError(
+                f"Expected a HxWx3 uint8 RGB frame, but got {frame.dtype} array "
+                f"of shape {frame.shape}"
+            )
+        return Image.fromarray(frame)
+    raise RuntimeError(f"Unsupported frame type: {type(frame)}")
+
+
+def normalize_uint8_image(img, img_mean, img_std):
+    """Normalize a uint8 image (with values in [0, 255]) by mean and std."""
+    img = img.float() / 255.0
+    img -= img_mean
+    img /= img_std
+    return img
+
+
+class JPEGFrameCache:
+    """
+    A list of video frames (already resized to image_size x image_size) held in CPU
+    memory as JPEG bytes, which are decoded back into uint8 tensors upon access.
+
+    Note that the JPEG encoding is lossy (with a high quality of `jpeg_quality`), so
+    the frames are slightly different from those held as float32 or uint8 tensors.
+    """
+
+    def __init__(self, num_frames, jpeg_quality=95):
+        self.jpeg_quality = jpeg_quality
+        self.frames = [None] * num_frames
+
+    def __setitem__(self, index, img):
+        img_np = img.permute(1, 2, 0).numpy()
+        buffer = io.BytesIO()
+        Image.fromarray(img_np).save(buffer, format="JPEG", quality=self.jpeg_quality)
+        self.frames[index] = buffer.getvalue()
+
+    def __getitem__(self, index):
+        img_np = np.array(Image.open(io.BytesIO(self.frames[index])))
+        return torch.from_numpy(img_np).permute(2, 0, 1)
+
+    def __len__(self):
+        return len(self.frames)
+
+    def num_bytes(self):
+        return sum(len(f) for f in self.frames if f is not None)
+
+
 class AsyncVideoFrameLoader:
     """
     A list of video frames to be load asynchronously without blocking session start.
@@ -114,14 +202,23 @@ class AsyncVideoFrameLoader:
         img_mean,
         img_std,
         compute_device,
+        desc="frame loading (JPEG)",
+        frame_storage="float32",
     ):
+        # `img_paths` is a list of JPEG file paths or a `VideoReader` on a video file
         self.img_paths = img_paths
         self.image_size = image_size
         self.offload_video_to_cpu = offload_video_to_cpu
         self.img_mean = img_mean
         self.img_std = img_std
+        # how to hold the frames (see `load_video_frames`), where "uint8" and "jpeg"
+        # frames are returned as uint8 tensors to be normalized before use
+        self.frame_storage = frame_storage
         # items in `self.images` will be loaded asynchronously
-        self.images = [None] * len(img_paths)
+        if frame_storage == "jpeg":
+            self.images = JPEGFrameCache(len(img_paths))
+        else:
+            self.images = [None] * len(img_paths)
         # catch and raise any exceptions in the async loading thread
         self.exception = None
         # video_height and video_width be filled when loading the first image
@@ -136,7 +233,7 @@ class AsyncVideoFrameLoader:
         # load the rest of frames asynchronously without blocking the session start
         def _load_frames():
             try:
-                for n in tqdm(range(len(self.images)), desc="frame loading (JPEG)"):
+                for n in tqdm(range(len(self.images)), desc=desc):
                     self.__getitem__(n)
             except Exception as e:
                 self.exception = e
@@ -148,25 +245,224 @@ class AsyncVideoFrameLoader:
         if self.exception is not None:
             raise RuntimeError("Failure in frame loading thread") from self.exception
 
-        img = self.images[index]
-        if img is not None:
-            return img
+        if self.frame_storage == "jpeg":
+            if self.images.frames[index] is not None:
+                return self.images[index]
+        else:
+            img = self.images[index]
+            if img is not None:
+                return img
 
+        keep_uint8 = self.frame_storage != "float32"
         img, video_height, video_width = _load_img_as_tensor(
-            self.img_paths[index], self.image_size
+            self.img_paths[index], self.image_size, keep_uint8=keep_uint8
         )
         self.video_height = video_height
         self.video_width = video_width
+        if not keep_uint8:
+            # normalize by mean and std
+            img -= self.img_mean
+            img /= self.img_std
+        if self.frame_storage == "jpeg":
+            self.images[index] = img  # JPEG frames are always held in CPU memory
+            return img
+        if not self.offload_video_to_cpu:
+            img = img.to(self.compute_device, non_blocking=True)
+        self.images[index] = img
+        return img
+
+    def __len__(self):
+        return len(self.images)
+
+
+class StreamingVideoFrames:
+    """
+    A list of video frames from a live stream (e.g. a camera feed) that grows as new
+    frames are appended. Only the most recent `max_frames_in_memory` frames are kept.
+    """
+
+    def __init__(
+        self,
+        image_size,
+        offload_video_to_cpu,
+        compute_device,
+        max_frames_in_memory=16,
+        img_mean=(0.485, 0.456, 0.406),
+        img_std=(0.229, 0.224, 0.225),
+    ):
+        self.image_size = image_size
+        self.offload_video_to_cpu = offload_video_to_cpu
+        self.compute_device = compute_device
+        self.max_frames_in_memory = max(max_frames_in_memory, 1)
+        self.img_mean = torch.tensor(img_mean, dtype=torch.float32)[:, None, None]
+        self.img_std = torch.tensor(img_std, dtype=torch.float32)[:, None, None]
+        self.images = OrderedDict()  # {frame_idx: img}
+        self.num_frames = 0
+        # video_height and video_width be filled when appending the first frame
+        self.video_height = None
+        self.video_width = None
+
+    def append(self, frame):
+        """Append a new frame to the stream and return its frame index."""
+        img_pil = _frame_to_pil_img(frame)
+        img, video_height, video_width = _pil_img_to_tensor(img_pil, self.image_size)
+        if self.video_height is None:
+            self.video_height = video_height
+            self.video_width = video_width
+        elif (video_height, video_width) != (self.video_height, self.video_width):
+            raise RuntimeError(
+                f"Frame size {video_width}x{video_height} doesn't match the stream "
+                f"size {self.video_width}x{self.video_height}"
+            )
         # normalize by mean and std
+        img = img.float()
         img -= self.img_mean
         img /= self.img_std
         if not self.offload_video_to_cpu:
             img = img.to(self.compute_device, non_blocking=True)
-        self.images[index] = img
+
+        frame_idx = self.num_frames
+        self.images[frame_idx] = img
+        self.num_frames += 1
+        while len(self.images) > self.max_frames_in_memory:
+            self.images.popitem(last=False)
+        return frame_idx
+
+    def __getitem__(self, index):
+        img = self.images.get(index, None)
+        if img is None:
+            raise IndexError(
+                f"Frame {index} is not available in the stream (only the most recent "
+                f"{self.max_frames_in_memory} frames are kept)"
+            )
         return img
 
     def __len__(self):
-        return len(self.images)
+        return self.num_frames
+
+    def __contains__(self, index):
+        """Whether a frame is still kept in memory."""
+        return index in self.images
+
+
+def _load_frames_in_parallel(
+    img_paths, images, image_size, num_workers, desc, keep_uint8=False
+):
+    """
+    Load the frames into the preallocated `images` tensor with a pool of threads (PIL
+    releases the GIL while decoding and resizing an image, so this scales with cores).
+    """
+
+    def _load_frame(n, img_path):
+        images[n], video_height, video_width = _load_img_as_tensor(
+            img_path, image_size, keep_uint8=keep_uint8
+        )
+        return video_height, video_width
+
+    num_frames = len(img_paths)
+    # The frames of a video file can only be decoded efficiently in order, so we read
+    # them here in the main thread and leave their resizing to the workers. To bound
+    # the memory of the decoded frames in flight, we only submit a few frames ahead.
+    max_pending = 2 * num_workers
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        with tqdm(total=num_frames, desc=desc) as pbar:
+            for n in range(num_frames):
+                if len(pending) >= max_pending:
+                    video_height, video_width = pending.popleft().result()
+                    pbar.update(1)
+                pending.append(executor.submit(_load_frame, n, img_paths[n]))
+            while len(pending) > 0:
+                video_height, video_width = pending.popleft().result()
+                pbar.update(1)
+    return video_height, video_width
+
+
+def _load_frames_into(images, img_paths, image_size, num_workers, desc, keep_uint8):
+    """Load all the frames into the preallocated `images`."""
+    if num_workers > 0:
+        return _load_frames_in_parallel(
+            img_paths, images, image_size, num_workers, desc, keep_uint8
+        )
+
+    for n in tqdm(range(len(img_paths)), desc=desc):
+        # (the frames of a video file are decoded sequentially, without seeking)
+        img_path = img_paths[n]
+        images[n], video_height, video_width = _load_img_as_tensor(
+            img_path, image_size, keep_uint8=keep_uint8
+        )
+    return video_height, video_width
+
+
+def _list_jpeg_frames(jpg_folder):
+    """List the paths of the JPEG frames ("<frame_index>.jpg" format) in a folder."""
+    frame_names = [
+        p
+        for p in os.listdir(jpg_folder)
+        if os.path.splitext(p)[-1] in [".jpg", ".jpeg", ".JPG", ".JPEG"]
+    ]
+    frame_names.sort(key=lambda p: int(os.path.splitext(p)[0]))
+    return [os.path.join(jpg_folder, name) for name in frame_names]
+
+
+def get_video_cache_key(video_path, image_size):
+    """
+    Get the key of a video in the on-disk caches from its path, its image size and
+    the modification times and sizes of its files (to detect any changes to it).
+    """
+    if os.path.isdir(video_path):
+        file_paths = _list_jpeg_frames(video_path)
+    else:
+        file_paths = [video_path]
+    file_stats = []
+    for file_path in file_paths:
+        stat = os.stat(file_path)
+        file_stats.append([os.path.basename(file_path), stat.st_mtime_ns, stat.st_size])
+    key = [os.path.abspath(video_path), image_size, file_stats]
+    return hashlib.sha1(json.dumps(key).encode("utf-8")).hexdigest()
+
+
+def _load_frames_with_disk_cache(
+    cache_dir, video_path, img_paths, image_size, num_workers, desc
+):
+    """
+    Load the frames of a video as a uint8 tensor memory-mapped from a preprocessed
+    frame file in `cache_dir`, which is first written if it's not there yet.
+
+    `img_paths` can be None for a video file, in which case the file is only opened
+    for decoding upon a cache miss.
+    """
+    key = get_video_cache_key(video_path, image_size)
+    frames_path = os.path.join(cache_dir, f"{key}.npy")
+    meta_path = os.path.join(cache_dir, f"{key}.json")
+    if not os.path.exists(frames_path):
+        if img_paths is None:
+            img_paths = VideoReader(video_path)
+        os.makedirs(cache_dir, exist_ok=True)
+        # write into temporary files and then move them into place, so that other
+        # processes never see a partially written cache (the frame file is moved last)
+        tmp_suffix = f".tmp{os.getpid()}"
+        shape = (len(img_paths), 3, image_size, image_size)
+        frames = np.lib.format.open_memmap(
+            frames_path + tmp_suffix, mode="w+", dtype=np.uint8, shape=shape
+        )
+        video_height, video_width = _load_frames_into(
+            torch.from_numpy(frames), img_paths, image_size, num_workers, desc, True
+        )
+        frames.flush()
+        del frames
+        meta = {"video_height": video_height, "video_width": video_width}
+        with open(meta_path + tmp_suffix, "w") as f:
+            json.dump(meta, f)
+        os.replace(meta_path + tmp_suffix, meta_path)
+        os.replace(frames_path + tmp_suffix, frames_path)
+
+    with open(meta_path, "r") as f:
+        meta = json.load(f)
+    # copy-on-write mapping, so that the tensor is writable but still backed by (and
+    # sharing the page cache of) the file
+    frames = np.load(frames_path, mmap_mode="c")
+    return torch.from_numpy(frames), meta["video_height"], meta["video_width"]
 
 
 def load_video_frames(
@@ -177,42 +473,61 @@ def load_video_frames(
     img_std=(0.229, 0.224, 0.225),
     async_loading_frames=False,
     compute_device=torch.device("cuda"),
+    num_loading_workers=0,
+    frame_storage="float32",
+    frame_cache_dir=None,
 ):
     """
-    Load the video frames from a directory of JPEG files ("<frame_index>.jpg" format).
+    Load the video frames from a directory of JPEG files ("<frame_index>.jpg" format)
+    or from a video file (e.g. MP4 or MKV, decoded with PyAV).
 
     The frames are resized to image_size x image_size and are loaded to GPU if
     `offload_video_to_cpu` is `False` and to CPU if `offload_video_to_cpu` is `True`.
 
     You can load a frame asynchronously by setting `async_loading_frames` to `True`.
+    You can also decode and resize the frames with a pool of `num_loading_workers`
+    threads (the default 0 loads them serially).
+
+    The frames are held as normalized float32 tensors by default. To save memory on
+    long videos, they can instead be held as uint8 tensors (`frame_storage="uint8"`,
+    4x smaller) or as JPEG bytes in CPU memory (`frame_storage="jpeg"`, lossy). In
+    both cases, the frames are returned as uint8 tensors to be normalized before use
+    (e.g. via `normalize_uint8_image`).
+
+    If `frame_cache_dir` is set, the resized frames are written into a uint8 file in
+    this directory upon the first load of a video, and later loads of the same video
+    (with the same file modification times and image size) memory-map this file
+    instead of decoding the video again. With `offload_video_to_cpu` and uint8 frame
+    storage, the frames are used directly from the memory-mapped file, sharing the
+    OS page cache across processes.
     """
+    if frame_storage not in ["float32", "uint8", "jpeg"]:
+        raise ValueError(f"Unknown frame storage: {frame_storage}")
+    if frame_cache_dir is not None and frame_storage == "jpeg":
+        raise ValueError("`frame_cache_dir` doesn't support JPEG frame storage")
     if isinstance(video_path, str) and os.path.isdir(video_path):
         jpg_folder = video_path
+        img_paths = _list_jpeg_frames(jpg_folder)
+        if len(img_paths) == 0:
+            raise RuntimeError(f"no images found in {jpg_folder}")
+        desc = "frame loading (JPEG)"
+    elif isinstance(video_path, str) and os.path.isfile(video_path):
+        # decode the video file directly, where `img_paths` holds the decoded frames
+        # (with a frame cache, the file is only opened if the video isn't cached yet,
+        # and the number of frames then comes from the cached frame file)
+        img_paths = VideoReader(video_path) if frame_cache_dir is None else None
+        desc = "frame loading (video)"
     else:
         raise NotImplementedError(
-            "Only JPEG frames are supported at this moment. For video files, you may use "
-            "ffmpeg (https://ffmpeg.org/) to extract frames into a folder of JPEG files, such as \n"
-            "```\n"
-            "ffmpeg -i <your_video>.mp4 -q:v 2 -start_number 0 <output_dir>/'%05d.jpg'\n"
-            "```\n"
-            "where `-q:v` generates high-quality JPEG frames and `-start_number 0` asks "
-            "ffmpeg to start the JPEG file from 00000.jpg."
+            "Only JPEG folders and video files are supported at this moment, but got "
+            f"{video_path}"
         )
 
-    frame_names = [
-        p
-        for p in os.listdir(jpg_folder)
-        if os.path.splitext(p)[-1] in [".jpg", ".jpeg", ".JPG", ".JPEG"]
-    ]
-    frame_names.sort(key=lambda p: int(os.path.splitext(p)[0]))
-    num_frames = len(frame_names)
-    if num_frames == 0:
-        raise RuntimeError(f"no images found in {jpg_folder}")
-    img_paths = [os.path.join(jpg_folder, frame_name) for frame_name in frame_names]
     img_mean = torch.tensor(img_mean, dtype=torch.float32)[:, None, None]
     img_std = torch.tensor(img_std, dtype=torch.float32)[:, None, None]
 
-    if async_loading_frames:
+    # (a memory-mapped frame file is opened instantly, so we don't load it async)
+    if async_loading_frames and frame_cache_dir is None:
         lazy_images = AsyncVideoFrameLoader(
             img_paths,
             image_size,
@@ -220,12 +535,40 @@ def load_video_frames(
             img_mean,
             img_std,
             compute_device,
+            desc=desc,
+            frame_storage=frame_storage,
         )
         return lazy_images, lazy_images.video_height, lazy_images.video_width
 
-    images = torch.zeros(num_frames, 3, image_size, image_size, dtype=torch.float32)
-    for n, img_path in enumerate(tqdm(img_paths, desc="frame loading (JPEG)")):
-        images[n], video_height, video_width = _load_img_as_tensor(img_path, image_size)
+    keep_uint8 = frame_storage != "float32"
+    if frame_cache_dir is not None:
+        # a uint8 tensor backed by the memory-mapped frame file in `frame_cache_dir`
+        images, video_height, video_width = _load_frames_with_disk_cache(
+            frame_cache_dir,
+            video_path,
+            img_paths,
+            image_size,
+            num_loading_workers,
+            desc,
+        )
+        if not keep_uint8:
+            images = images.float() / 255.0
+    else:
+        num_frames = len(img_paths)
+        if frame_storage == "jpeg":
+            images = JPEGFrameCache(num_frames)
+        else:
+            dtype = torch.uint8 if keep_uint8 else torch.float32
+            images = torch.zeros(num_frames, 3, image_size, image_size, dtype=dtype)
+        video_height, video_width = _load_frames_into(
+            images, img_paths, image_size, num_loading_workers, desc, keep_uint8
+        )
+    if frame_storage == "jpeg":
+        return images, video_height, video_width  # always held in CPU memory
+    if keep_uint8:
+        if not offload_video_to_cpu:
+            images = images.to(compute_device)
+        return images, video_height, video_width
     if not offload_video_to_cpu:
         images = images.to(compute_device)
         img_mean = img_mean.to(compute_device)
@@ -265,6 +608,66 @@ def fill_holes_in_mask_scores(mask, max_area):
     return mask
 
 
+def _bilinear_source_index(out_start, out_end, in_size, out_size, device):
+    """
+    Get the source indices and weights of bilinear resizing (as in `F.interpolate`
+    with `align_corners=False`) for the output positions in [out_start, out_end).
+    """
+    out_pos = torch.arange(out_start, out_end, device=device, dtype=torch.float32)
+    src_pos = ((out_pos + 0.5) * (in_size / out_size) - 0.5).clamp(min=0)
+    idx0 = src_pos.floor().long().clamp(max=in_size - 1)
+    idx1 = (idx0 + 1).clamp(max=in_size - 1)
+    weight1 = src_pos - idx0
+    return idx0, idx1, weight1
+
+
+def resize_mask_scores_in_roi(mask, size, margin, fill_value):
+    """
+    Bilinearly resize the mask scores `mask` of [B, 1, h, w] shape into `size` (as
+    `F.interpolate` with `align_corners=False`), but only in each object's region of
+    interest, i.e. the bounding box of its positive scores expanded by `margin` pixels
+    of the input resolution. The scores outside the region (and on the objects without
+    any positive scores) are set to `fill_value`.
+
+    With `margin >= 1`, the resized scores outside the region would be non-positive,
+    so thresholding at 0 gives the same binary masks as resizing the whole mask.
+    """
+    B, _, h, w = mask.shape
+    H, W = size
+    device = mask.device
+    out = mask.new_full((B, 1, H, W), fill_value)
+    is_pos = mask[:, 0] > 0
+    rows_with_pos = is_pos.any(dim=2)  # [B, h]
+    cols_with_pos = is_pos.any(dim=1)  # [B, w]
+    # the first and last rows and columns with positive scores of each object
+    bounds = torch.stack(
+        [
+            rows_with_pos.any(dim=1).long(),
+            rows_with_pos.long().argmax(dim=1),
+            h - 1 - rows_with_pos.flip(dims=[1]).long().argmax(dim=1),
+            cols_with_pos.long().argmax(dim=1),
+            w - 1 - cols_with_pos.flip(dims=[1]).long().argmax(dim=1),
+        ],
+        dim=1,
+    ).tolist()
+    for i, (has_pos, y_min, y_max, x_min, x_max) in enumerate(bounds):
+        if not has_pos:
+            continue  # skip the objects without any foreground
+        # the output pixels whose centers lie in the expanded box on the input
+        y_min, y_max = max(y_min - margin, 0), min(y_max + margin, h - 1)
+        x_min, x_max = max(x_min - margin, 0), min(x_max + margin, w - 1)
+        out_y0, out_y1 = y_min * H // h, -(-(y_max + 1) * H // h)
+        out_x0, out_x1 = x_min * W // w, -(-(x_max + 1) * W // w)
+        y_idx0, y_idx1, y_weight1 = _bilinear_source_index(out_y0, out_y1, h, H, device)
+        x_idx0, x_idx1, x_weight1 = _bilinear_source_index(out_x0, out_x1, w, W, device)
+        # resize along the columns and then along the rows
+        x = mask[i, 0]
+        x = x[:, x_idx0] * (1 - x_weight1) + x[:, x_idx1] * x_weight1
+        x = x[y_idx0] * (1 - y_weight1[:, None]) + x[y_idx1] * y_weight1[:, None]
+        out[i, 0, out_y0:out_y1, out_x0:out_x1] = x
+    return out
+
+
 def concat_points(old_point_inputs, new_points, new_labels):
     """Add new points and labels to previous point inputs (add at the end)."""
     if old_point_inputs is None:
@@ -274,3 +677,163 @@ def concat_points(old_point_inputs, new_points, new_labels):
         labels = torch.cat([old_point_inputs["point_labels"], new_labels], dim=1)
 
     return {"point_coords": points, "point_labels": labels}
+
+
+def slice_frame_output(current_out, obj_slice):
+    """Get a slice of the objects (along the batch dim) from a multi-object output."""
+    obj_out = {
+        "maskmem_features": None,
+        "maskmem_pos_enc": None,
+        "pred_masks": current_out["pred_masks"][obj_slice],
+        "obj_ptr": current_out["obj_ptr"][obj_slice],
+    }
+    if current_out["maskmem_features"] is not None:
+        obj_out["maskmem_features"] = current_out["maskmem_features"][obj_slice]
+    if current_out["maskmem_pos_enc"] is not None:
+        maskmem_pos_enc = current_out["maskmem_pos_enc"]
+        obj_out["maskmem_pos_enc"] = [x[obj_slice] for x in maskmem_pos_enc]
+    return obj_out
+
+
+class SlicedFrameOutputs(Mapping):
+    """
+    A read-only view of a dict of multi-object frame outputs ({frame_idx: output})
+    that only holds the objects in `obj_slice`. The outputs are sliced lazily upon
+    lookup, so the view is cheap to create no matter how many frames there are.
+    """
+
+    def __init__(self, frame_outputs, obj_slice):
+        self.frame_outputs = frame_outputs
+        self.obj_slice = obj_slice
+
+    def __getitem__(self, frame_idx):
+        return slice_frame_output(self.frame_outputs[frame_idx], self.obj_slice)
+
+    def __iter__(self):
+        return iter(self.frame_outputs)
+
+    def __len__(self):
+        return len(self.frame_outputs)
+
+    def __contains__(self, frame_idx):
+        return frame_idx in self.frame_outputs
+
+
+class StridedFrameOutputs(Mapping):
+    """
+    A read-only view of a dict of frame outputs ({frame_idx: output}) on the timeline
+    of every `stride`-th frame starting from frame `offset`, i.e. where frame `t` has
+    the index `(t - offset) / stride`. This is to track only every `stride`-th frame
+    as if they were consecutive frames. The frames in between (e.g. conditioning frames
+    off the strided timeline) get fractional indices.
+    """
+
+    def __init__(self, frame_outputs, offset, stride):
+        self.frame_outputs = frame_outputs
+        self.offset = offset
+        self.stride = stride
+
+    def _to_frame_idx(self, strided_idx):
+        frame_idx = strided_idx * self.stride + self.offset
+        # fractional indices are rounded back to the frame they were computed from
+        if abs(frame_idx - round(frame_idx)) > 1e-6:
+            raise KeyError(strided_idx)
+        return round(frame_idx)
+
+    def _to_strided_idx(self, frame_idx):
+        q, r = divmod(frame_idx - self.offset, self.stride)
+        return q if r == 0 else (frame_idx - self.offset) / self.stride
+
+    def __getitem__(self, strided_idx):
+        return self.frame_outputs[self._to_frame_idx(strided_idx)]
+
+    def __iter__(self):
+        return (self._to_strided_idx(t) for t in self.frame_outputs)
+
+    def __len__(self):
+        return len(self.frame_outputs)
+
+    def __contains__(self, strided_idx):
+        try:
+            return self._to_frame_idx(strided_idx) in self.frame_outputs
+        except KeyError:
+            return False
+
+
+class ObjectFrameOutputs(MutableMapping):
+    """
+    The outputs of the object `obj_idx` on video frames ({frame_idx: output}) as a view
+    of the multi-object outputs in `output_dict`. Instead of holding a per-object slice
+    of the outputs on each frame, it only records the frames of this object (added via
+    `link`) and slices the multi-object output on a frame upon lookup (looking it up in
+    "cond_frame_outputs" first and then in "non_cond_frame_outputs"). Therefore, the
+    view always reflects the current multi-object outputs and `obj_idx`. Any outputs
+    assigned directly (e.g. `view[frame_idx] = out`) are held as they are.
+    """
+
+    def __init__(self, output_dict, obj_idx):
+        self.output_dict = output_dict
+        self.obj_idx = obj_idx
+        # {frame_idx: None} for the frames sliced from `output_dict` upon lookup, or
+        # {frame_idx: out} for the outputs held as they are (in insertion order)
+        self.outputs = {}
+
+    def link(self, frame_idx):
+        """Add this object's slice of the multi-object output on a frame."""
+        self.outputs[frame_idx] = None
+
+    def __getitem__(self, frame_idx):
+        out = self.outputs[frame_idx]
+        if out is not None:
+            return out
+        multi_obj_out = self.output_dict["cond_frame_outputs"].get(frame_idx, None)
+        if multi_obj_out is None:
+            multi_obj_out = self.output_dict["non_cond_frame_outputs"][frame_idx]
+        return slice_frame_output(multi_obj_out, slice(self.obj_idx, self.obj_idx + 1))
+
+    def __setitem__(self, frame_idx, out):
+        self.outputs[frame_idx] = out
+
+    def __delitem__(self, frame_idx):
+        del self.outputs[frame_idx]
+
+    def pop(self, frame_idx, *default):
+        # (unlike `MutableMapping.pop`, this doesn't look up the output first, which
+        # fails once the multi-object output on this frame has been removed)
+        return self.outputs.pop(frame_idx, *default)
+
+    def __iter__(self):
+        return iter(self.outputs)
+
+    def __len__(self):
+        return len(self.outputs)
+
+    def __contains__(self, frame_idx):
+        return frame_idx in self.outputs
+
+    def clear(self):
+        self.outputs.clear()
+
+
+def pack_tensor(arrays, x):
+    """
+    Add a tensor into a dict of numpy `arrays` (e.g. to be saved via `np.savez`) and
+    return a JSON-serializable reference to it. Since numpy has no bfloat16 type, the
+    bfloat16 tensors are stored by the raw bits of their values as int16 arrays.
+    """
+    name = f"arr_{len(arrays)}"
+    dtype = str(x.dtype).replace("torch.", "")
+    x = x.detach().cpu()
+    if x.dtype == torch.bfloat16:
+        x = x.view(torch.int16)
+    arrays[name] = x.numpy()
+    return {"name": name, "dtype": dtype}
+
+
+def unpack_tensor(arrays, ref, device):
+    """Load a tensor added via `pack_tensor` from `arrays` onto `device`."""
+    x = torch.from_numpy(arrays[ref["name"]])
+    dtype = getattr(torch, ref["dtype"])
+    if dtype == torch.bfloat16:
+        x = x.view(torch.bfloat16)
+    return x.to(device, non_blocking=True)
@@ -0,0 +1,123 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import weakref
+
+import torch
+
+from sam2.utils.quantization import dequantize, QuantizedTensor
+
+
+class PinnedMemoryPool:
+    """
+    A pool of reusable page-locked (pinned) CPU buffers to offload the outputs on video
+    frames from GPU into, so that the copies (in both directions) run asynchronously
+    and at full bandwidth, unlike those into pageable memory.
+
+    The buffers are allocated in slabs of `slab_size` buffers of the same shape and
+    dtype (i.e. those of the per-frame outputs). A buffer handed out by `copy_from` goes
+    back into the pool once the returned tensor and all its views (e.g. per-object
+    slices) are garbage collected, i.e. when its output is evicted or replaced upon
+    re-tracking, so that the later frames reuse it instead of allocating new pinned
+    memory. The copies are asynchronous, so `synchronize` must be called before reading
+    the buffers on CPU.
+    """
+
+    def __init__(self, slab_size=16):
+        self.slab_size = slab_size
+        self.free_buffers = {}  # {(shape, dtype): [buffer, ...]}
+        self.num_bytes = 0  # the total size of the buffers in the pool or in use
+        self.copy_event = None  # recorded after the latest copy
+        # incremented upon `clear`, so that the buffers in use are dropped once released
+        self.generation = 0
+
+    def _get_buffer(self, shape, dtype):
+        key = (tuple(shape), dtype)
+        free_buffers = self.free_buffers.setdefault(key, [])
+        if len(free_buffers) == 0:
+            slab = torch.empty((self.slab_size,) + key[0], dtype=dtype, pin_memory=True)
+            self.num_bytes += slab.nbytes
+            # (hold the buffers as raw bytes, which numpy supports for any dtype)
+            slab = slab.view(self.slab_size, -1).view(torch.uint8)
+            free_buffers.extend(slab.unbind(0))
+        buffer = free_buffers.pop()
+        # Hand out a tensor on a new storage that wraps the buffer via a numpy array,
+        # which the storage keeps alive until the tensor and all its views are garbage
+        # collected (as they share this storage). The buffer is then released back into
+        # the pool, so it's never reused while any view of it is still in use.
+        array = buffer.numpy()
+        finalizer = weakref.finalize(array, self._release, key, buffer, self.generation)
+        finalizer.atexit = False
+        return torch.from_numpy(array).view(dtype).view(shape)
+
+    def _release(self, key, buffer, generation):
+        if generation == self.generation:
+            self.free_buffers.setdefault(key, []).append(buffer)
+        else:
+            # the pool has been cleared since this buffer was handed out
+            self.num_bytes -= buffer.nbytes
+
+    def copy_from(self, x):
+        """Copy a GPU tensor into a pinned CPU buffer asynchronously."""
+        y = self._get_buffer(x.shape, x.dtype)
+        y.copy_(x, non_blocking=True)
+        self.copy_event = torch.cuda.Event()
+        self.copy_event.record()
+        return y
+
+    def synchronize(self):
+        """Wait for all the copies into the buffers to finish."""
+        if self.copy_event is not None:
+            self.copy_event.synchronize()
+            self.copy_event = None
+
+    def clear(self):
+        """Drop the free buffers (and those in use once they are released)."""
+        for free_buffers in self.free_buffers.values():
+            self.num_bytes -= sum(buffer.nbytes for buffer in free_buffers)
+        self.free_buffers = {}
+        self.generation += 1
+
+
+def _copy_into_buffer(tensors, device):
+    buffer = torch.empty(
+        (len(tensors),) + tuple(tensors[0].shape),
+        dtype=tensors[0].dtype,
+        device=device,
+    )
+    for x, dst in zip(tensors, buffer.unbind(0)):
+        dst.copy_(x, non_blocking=True)
+    return buffer
+
+
+def gather_to_device(tensors, device):
+    """
+    Load a list of stored tensors (regular or quantized ones, e.g. the memory features
+    of several frames) onto `device`. The tensors on another device (e.g. offloaded to
+    CPU) with the same shape and dtype are gathered into a single buffer on `device`
+    (via asynchronous copies without waiting on the host) and dequantized all at once,
+    instead of a separate allocation and dequantization for each tensor.
+    """
+    device = torch.device(device)
+    outputs = [None] * len(tensors)
+    to_gather = {}  # {(type, shape, dtype): [tensor index, ...]}
+    for i, x in enumerate(tensors):
+        if x.device == device:
+            outputs[i] = dequantize(x, device)
+        else:
+            key = (type(x), tuple(x.shape), x.dtype)
+            to_gather.setdefault(key, []).append(i)
+    for inds in to_gather.values():
+        xs = [tensors[i] for i in inds]
+        if isinstance(xs[0], QuantizedTensor):
+            data = _copy_into_buffer([x.data for x in xs], device)
+            scale = _copy_into_buffer([x.scale for x in xs], device)
+            gathered = (data.float() * scale).to(xs[0].dtype)
+        else:
+            gathered = _copy_into_buffer(xs, device)
+        for i, x in zip(inds, gathered.unbind(0)):
+            outputs[i] = x
+    return outputs
@@ -0,0 +1,115 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import torch
+
+
+class QuantizedTensor:
+    """
+    An int8-quantized [B, C, H, W] tensor with a float32 scale for each (batch, channel)
+    pair, to hold the outputs on video frames (e.g. memory features or mask logits) in
+    the session state at a fraction of their size. It supports the few tensor ops used
+    on the stored outputs, i.e. moving across devices, slicing along (or concatenating
+    over) the batch dim of the objects and writing into a batch slice, while
+    `dequantize` converts it back into a regular tensor in its original dtype.
+
+    By default, the scale of each channel is taken from its absolute max value. If
+    `clamp` is set, the values are instead clamped into [-clamp, clamp] under a fixed
+    scale, which suits mask logits whose large magnitudes (e.g. NO_OBJ_SCORE) don't
+    carry more information than their sign.
+    """
+
+    def __init__(self, data, scale, dtype, clamp=None):
+        self.data = data  # int8 values
+        self.scale = scale  # float32 scales in [B, C, 1, 1]
+        self.dtype = dtype  # the dtype of the dequantized tensor
+        self.clamp = clamp
+
+    @classmethod
+    def quantize(cls, x, clamp=None, dtype=None):
+        """Quantize a [B, C, H, W] tensor (to be dequantized into `dtype` if given)."""
+        dtype = x.dtype if dtype is None else dtype
+        x = x.float()
+        if clamp is None:
+            absmax = x.abs().amax(dim=(2, 3), keepdim=True)
+        else:
+            x = x.clamp(-clamp, clamp)
+            absmax = x.new_full((x.size(0), x.size(1), 1, 1), clamp)
+        scale = absmax.clamp(min=1e-8) / 127
+        data = torch.round(x / scale).clamp(-127, 127).to(torch.int8)
+        return cls(data, scale, dtype, clamp)
+
+    def dequantize(self, device=None, non_blocking=False):
+        data = self.data.to(device, non_blocking=non_blocking)
+        scale = self.scale.to(device, non_blocking=non_blocking)
+        return (data.float() * scale).to(self.dtype)
+
+    def to(self, device, non_blocking=False):
+        return QuantizedTensor(
+            self.data.to(device, non_blocking=non_blocking),
+            self.scale.to(device, non_blocking=non_blocking),
+            self.dtype,
+            self.clamp,
+        )
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    @property
+    def device(self):
+        return self.data.device
+
+    def size(self, dim=None):
+        return self.data.size() if dim is None else self.data.size(dim)
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes + self.scale.nbytes
+
+    def __getitem__(self, idx):
+        # (only indexing along the batch dim is supported)
+        return QuantizedTensor(self.data[idx], self.scale[idx], self.dtype, self.clamp)
+
+    def __setitem__(self, idx, value):
+        if not isinstance(value, QuantizedTensor):
+            value = QuantizedTensor.quantize(value, self.clamp, self.dtype)
+        self.data[idx] = value.data.to(self.device)
+        self.scale[idx] = value.scale.to(self.device)
+
+    def new_full(self, size, fill_value):
+        x = torch.full(size, fill_value, dtype=torch.float32, device=self.device)
+        return QuantizedTensor.quantize(x, self.clamp, self.dtype)
+
+    def new_zeros(self, size):
+        return self.new_full(size, 0.0)
+
+    @staticmethod
+    def cat(tensors):
+        """Concatenate quantized tensors along the batch dim."""
+        return QuantizedTensor(
+            torch.cat([x.data for x in tensors]),
+            torch.cat([x.scale for x in tensors]),
+            tensors[0].dtype,
+            tensors[0].clamp,
+        )
+
+
+def dequantize(x, device=None, dtype=None, non_blocking=False):
+    """
+    Convert a stored tensor (either a regular tensor or a `QuantizedTensor`) back into
+    a regular tensor on `device` (and in `dtype` if given).
+    """
+    if isinstance(x, QuantizedTensor):
+        x = x.dequantize(device, non_blocking=non_blocking)
+    return x.to(device=device, dtype=dtype, non_blocking=non_blocking)
+
+
+def cat_tensors(tensors):
+    """Concatenate stored tensors (regular or quantized ones) along the batch dim."""
+    if isinstance(tensors[0], QuantizedTensor):
+        return QuantizedTensor.cat(tensors)
+    return torch.cat(tensors)
@@ -0,0 +1,107 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import bisect
+from threading import Lock
+
+
+class VideoReader:
+    """
+    Frame-accurate random access to the frames of a video container (e.g. MP4 or MKV)
+    decoded with PyAV (https://github.com/PyAV-Org/PyAV).
+
+    Upon opening, we demux (but don't decode) the video stream once to build a seek
+    index of the presentation timestamps of all frames and of all keyframes. Reading a
+    frame then seeks to the closest keyframe at or before it and decodes forward from
+    there, while reading the frames in order just continues decoding without seeking.
+    """
+
+    def __init__(self, video_path):
+        try:
+            import av
+        except ImportError as e:
+            raise ImportError(
+                "Decoding video files requires PyAV; please install it via `pip "
+                "install av` or extract the frames into a folder of JPEG files instead."
+            ) from e
+
+        self.video_path = video_path
+        self.container = av.open(video_path)
+        self.stream = self.container.streams.video[0]
+        self.stream.thread_type = "AUTO"
+
+        # build the seek index from the packet timestamps (packets are in decoding
+        # order, so we sort them to get the frames in presentation order)
+        frame_pts, keyframe_pts = [], []
+        for packet in self.container.demux(self.stream):
+            if packet.pts is None:  # the flushing packet at the end of the stream
+                continue
+            frame_pts.append(packet.pts)
+            if packet.is_keyframe:
+                keyframe_pts.append(packet.pts)
+        if len(frame_pts) == 0:
+            raise RuntimeError(f"no video frames found in {video_path}")
+        self.frame_pts = sorted(frame_pts)
+        self.keyframe_pts = sorted(keyframe_pts)
+        if len(self.keyframe_pts) == 0 or self.keyframe_pts[0] > self.frame_pts[0]:
+            # fall back to seeking from the start of the stream
+            self.keyframe_pts.insert(0, self.frame_pts[0])
+
+        codec_context = self.stream.codec_context
+        self.video_height = codec_context.height
+        self.video_width = codec_context.width
+        # the decoder state, i.e. the decoded frame iterator and the index of the next
+        # frame it yields (`None` means that we need to seek before decoding)
+        self._decoded_frames = None
+        self._next_index = None
+        # guard the decoder state, as the frames may be read from several threads
+        self.lock = Lock()
+
+    def _seek(self, index):
+        """Seek to the closest keyframe at or before the frame `index`."""
+        target_pts = self.frame_pts[index]
+        key_pos = bisect.bisect_right(self.keyframe_pts, target_pts) - 1
+        key_pts = self.keyframe_pts[max(key_pos, 0)]
+        self.container.seek(key_pts, backward=True, any_frame=False, stream=self.stream)
+        self._decoded_frames = self.container.decode(self.stream)
+        self._next_index = bisect.bisect_left(self.frame_pts, key_pts)
+
+    def _needs_seek(self, index):
+        if self._next_index is None or index < self._next_index:
+            return True
+        # seeking is faster than decoding forward if there is a keyframe in between
+        next_pts = self.frame_pts[self._next_index]
+        target_pts = self.frame_pts[index]
+        key_pos = bisect.bisect_right(self.keyframe_pts, next_pts)
+        if key_pos == len(self.keyframe_pts):
+            return False
+        return self.keyframe_pts[key_pos] <= target_pts
+
+    def __getitem__(self, index):
+        """Decode the frame at `index` into a PIL image."""
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError(f"frame {index} is out of range in {self.video_path}")
+
+        with self.lock:
+            if self._needs_seek(index):
+                self._seek(index)
+            target_pts = self.frame_pts[index]
+            for frame in self._decoded_frames:
+                if frame.pts is None or frame.pts < target_pts:
+                    continue
+                self._next_index = bisect.bisect_right(self.frame_pts, frame.pts)
+                return frame.to_image()
+
+            self._next_index = None
+            raise RuntimeError(f"failed to decode frame {index} in {self.video_path}")
+
+    def __len__(self):
+        return len(self.frame_pts)
+
+    def close(self):
+        self.container.close()
@@ -33,6 +33,7 @@ REQUIRED_PACKAGES = [
 
 EXTRA_PACKAGES = {
     "demo": ["matplotlib>=3.9.1", "jupyter>=1.0.0", "opencv-python>=4.7.0"],
+    "video": ["av>=12.0.0"],
     "dev": ["black==24.2.0", "usort==1.0.2", "ufmt==2.0.0b2"],
 }
 
@@ -0,0 +1,271 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+import argparse
+import os
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from sam2.build_sam import build_sam2_video_predictor
+from vos_inference import init_video_state, load_masks_from_dir
+
+
+STORAGE_DTYPES = {
+    "float32": torch.float32,
+    "float16": torch.float16,
+    "bfloat16": torch.bfloat16,
+    "int8": torch.int8,
+}
+
+
+def eval_region_j(gt, pred):
+    """The region similarity J (i.e. the IoU) between two binary masks."""
+    union = np.logical_or(gt, pred).sum()
+    if union == 0:
+        return 1.0
+    return np.logical_and(gt, pred).sum() / union
+
+
+def _get_boundary(mask):
+    """The boundary pixels of a binary mask (those with a background 4-neighbor)."""
+    padded = np.pad(mask, 1, mode="edge")
+    eroded = (
+        mask
+        & padded[:-2, 1:-1]
+        & padded[2:, 1:-1]
+        & padded[1:-1, :-2]
+        & padded[1:-1, 2:]
+    )
+    return mask & ~eroded
+
+
+def _dilate(mask, radius):
+    x = torch.from_numpy(mask.astype(np.float32))[None, None]
+    x = F.max_pool2d(x, kernel_size=2 * radius + 1, stride=1, padding=radius)
+    return x[0, 0].numpy() > 0
+
+
+def eval_boundary_f(gt, pred, bound_th=0.008):
+    """
+    The contour accuracy F between two binary masks as in the DAVIS benchmark, i.e. the
+    F-measure of the boundary pixels matched within a tolerance of `bound_th` times the
+    image diagonal (under a square instead of a disk structuring element).
+    """
+    bound_pix = int(np.ceil(bound_th * np.linalg.norm(gt.shape)))
+    gt_boundary = _get_boundary(gt)
+    pred_boundary = _get_boundary(pred)
+    num_gt = gt_boundary.sum()
+    num_pred = pred_boundary.sum()
+    if num_gt == 0 and num_pred == 0:
+        return 1.0
+    if num_gt == 0 or num_pred == 0:
+        return 0.0
+    precision = (pred_boundary & _dilate(gt_boundary, bound_pix)).sum() / num_pred
+    recall = (gt_boundary & _dilate(pred_boundary, bound_pix)).sum() / num_gt
+    if precision + recall == 0:
+        return 0.0
+    return 2 * precision * recall / (precision + recall)
+
+
+def eval_j_and_f(gt_segments, pred_segments):
+    """
+    Evaluate the mean J, F and J&F of the predicted per-object masks against the
+    reference ones, over all objects and frames in `gt_segments` (the objects missing
+    in `pred_segments` count as empty masks).
+    """
+    j_scores, f_scores = [], []
+    for frame_idx, gt_per_obj_mask in gt_segments.items():
+        pred_per_obj_mask = pred_segments.get(frame_idx, {})
+        for obj_id, gt_mask in gt_per_obj_mask.items():
+            gt_mask = gt_mask.reshape(gt_mask.shape[-2:])
+            pred_mask = pred_per_obj_mask.get(obj_id, None)
+            if pred_mask is None:
+                pred_mask = np.zeros_like(gt_mask)
+            pred_mask = pred_mask.reshape(gt_mask.shape)
+            j_scores.append(eval_region_j(gt_mask, pred_mask))
+            f_scores.append(eval_boundary_f(gt_mask, pred_mask))
+    j_mean, f_mean = float(np.mean(j_scores)), float(np.mean(f_scores))
+    return {"J": j_mean, "F": f_mean, "J&F": (j_mean + f_mean) / 2}
+
+
+def get_stored_output_nbytes(inference_state):
+    """The total size of the stored memory features and mask logits in a session."""
+    nbytes = 0
+    for outputs in inference_state["output_dict"].values():
+        for out in outputs.values():
+            for key in ["maskmem_features", "pred_masks"]:
+                if out[key] is not None:
+                    nbytes += out[key].nbytes
+    return nbytes
+
+
+@torch.inference_mode()
+@torch.autocast(device_type="cuda", dtype=torch.bfloat16)
+def track_video(
+    predictor,
+    base_video_dir,
+    input_mask_dir,
+    video_name,
+    score_thresh=0.0,
+    per_obj_png_file=False,
+    maskmem_storage_dtype=torch.bfloat16,
+    pred_masks_storage_dtype=torch.float32,
+):
+    """
+    Track the objects in the first frame's input masks throughout a video, holding the
+    outputs in the session under the given storage dtypes.
+    """
+    inference_state, frame_names, _ = init_video_state(
+        predictor=predictor,
+        base_video_dir=base_video_dir,
+        input_mask_dir=input_mask_dir,
+        video_name=video_name,
+        per_obj_png_file=per_obj_png_file,
+        maskmem_storage_dtype=maskmem_storage_dtype,
+        pred_masks_storage_dtype=pred_masks_storage_dtype,
+    )
+    video_segments = {}
+    for out_frame_idx, out_obj_ids, out_mask_logits in predictor.propagate_in_video(
+        inference_state
+    ):
+        video_segments[out_frame_idx] = {
+            out_obj_id: (out_mask_logits[i] > score_thresh).cpu().numpy()
+            for i, out_obj_id in enumerate(out_obj_ids)
+        }
+    return video_segments, frame_names, get_stored_output_nbytes(inference_state)
+
+
+def load_gt_segments(input_mask_dir, video_name, frame_names):
+    """Load the ground-truth masks on all annotated frames (except the input frame)."""
+    gt_segments = {}
+    for frame_idx, frame_name in enumerate(frame_names):
+        mask_path = os.path.join(input_mask_dir, video_name, f"{frame_name}.png")
+        if frame_idx == 0 or not os.path.exists(mask_path):
+            continue
+        per_obj_mask, _ = load_masks_from_dir(
+            input_mask_dir=input_mask_dir,
+            video_name=video_name,
+            frame_name=frame_name,
+            per_obj_png_file=False,
+        )
+        gt_segments[frame_idx] = per_obj_mask
+    return gt_segments
+
+
+def format_scores(scores):
+    return ", ".join(f"{k} = {v * 100:.2f}" for k, v in scores.items())
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the J&F drift of tracking a video with the outputs stored "
+        "in lower precision (e.g. int8) against the default storage dtypes"
+    )
+    parser.add_argument(
+        "--sam2_cfg",
+        type=str,
+        default="sam2_hiera_b+.yaml",
+        help="SAM 2 model configuration file",
+    )
+    parser.add_argument(
+        "--sam2_checkpoint",
+        type=str,
+        default="./checkpoints/sam2_hiera_b+.pt",
+        help="path to the SAM 2 model checkpoint",
+    )
+    parser.add_argument(
+        "--base_video_dir",
+        type=str,
+        required=True,
+        help="directory containing videos (as JPEG files)",
+    )
+    parser.add_argument(
+        "--input_mask_dir",
+        type=str,
+        required=True,
+        help="directory containing input masks (as PNG files) of each video",
+    )
+    parser.add_argument(
+        "--video_name",
+        type=str,
+        required=True,
+        help="the sample video to track (a subdirectory in base_video_dir)",
+    )
+    parser.add_argument(
+        "--maskmem_storage_dtype",
+        type=str,
+        default="int8",
+        choices=["bfloat16", "int8"],
+        help="storage dtype of the memory features to check (default: int8)",
+    )
+    parser.add_argument(
+        "--pred_masks_storage_dtype",
+        type=str,
+        default="int8",
+        choices=["float32", "float16", "int8"],
+        help="storage dtype of the low-res mask logits to check (default: int8)",
+    )
+    parser.add_argument(
+        "--score_thresh",
+        type=float,
+        default=0.0,
+        help="threshold for the output mask logits (default: 0.0)",
+    )
+    parser.add_argument(
+        "--per_obj_png_file",
+        action="store_true",
+        help="whether the input masks are per-object PNG files (as in SA-V); the "
+        "ground-truth evaluation is only done on single PNG files (as in DAVIS)",
+    )
+    args = parser.parse_args()
+
+    hydra_overrides_extra = [
+        "++model.non_overlap_masks=" + ("false" if args.per_obj_png_file else "true")
+    ]
+    predictor = build_sam2_video_predictor(
+        config_file=args.sam2_cfg,
+        ckpt_path=args.sam2_checkpoint,
+        hydra_overrides_extra=hydra_overrides_extra,
+    )
+    track_kwargs = dict(
+        predictor=predictor,
+        base_video_dir=args.base_video_dir,
+        input_mask_dir=args.input_mask_dir,
+        video_name=args.video_name,
+        score_thresh=args.score_thresh,
+        per_obj_png_file=args.per_obj_png_file,
+    )
+    ref_segments, frame_names, ref_nbytes = track_video(**track_kwargs)
+    test_segments, _, test_nbytes = track_video(
+        **track_kwargs,
+        maskmem_storage_dtype=STORAGE_DTYPES[args.maskmem_storage_dtype],
+        pred_masks_storage_dtype=STORAGE_DTYPES[args.pred_masks_storage_dtype],
+    )
+
+    print(
+        f"stored outputs: {ref_nbytes / 2**20:.1f} MiB (maskmem bfloat16, pred_masks "
+        f"float32) vs {test_nbytes / 2**20:.1f} MiB (maskmem "
+        f"{args.maskmem_storage_dtype}, pred_masks {args.pred_masks_storage_dtype})"
+    )
+    # the agreement of the outputs with the reference outputs (100 means no drift)
+    scores = eval_j_and_f(ref_segments, test_segments)
+    print(f"agreement with the reference outputs: {format_scores(scores)}")
+    if not args.per_obj_png_file:
+        gt_segments = load_gt_segments(
+            args.input_mask_dir, args.video_name, frame_names
+        )
+        if len(gt_segments) > 0:
+            ref_scores = eval_j_and_f(gt_segments, ref_segments)
+            test_scores = eval_j_and_f(gt_segments, test_segments)
+            drift = test_scores["J&F"] - ref_scores["J&F"]
+            print(f"reference vs ground truth: {format_scores(ref_scores)}")
+            print(f"quantized vs ground truth: {format_scores(test_scores)}")
+            print(f"J&F drift: {drift * 100:+.2f}")
+
+
+if __name__ == "__main__":
+    main()
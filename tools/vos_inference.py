@@ -105,19 +105,19 @@ def save_masks_to_dir(
             save_ann_png(output_mask_path, output_mask, output_palette)
 
 
-@torch.inference_mode()
-@torch.autocast(device_type="cuda", dtype=torch.bfloat16)
-def vos_inference(
+def init_video_state(
     predictor,
     base_video_dir,
     input_mask_dir,
-    output_mask_dir,
     video_name,
-    score_thresh=0.0,
     use_all_masks=False,
     per_obj_png_file=False,
+    num_loading_workers=0,
+    feature_store_dir=None,
+    maskmem_storage_dtype=torch.bfloat16,
+    pred_masks_storage_dtype=torch.float32,
 ):
-    """Run VOS inference on a single video with the given predictor."""
+    """Initialize the inference state on a video and add its input masks."""
     # load the video frames and initialize the inference state on this video
     video_dir = os.path.join(base_video_dir, video_name)
     frame_names = [
@@ -127,10 +127,13 @@ def vos_inference(
     ]
     frame_names.sort(key=lambda p: int(os.path.splitext(p)[0]))
     inference_state = predictor.init_state(
-        video_path=video_dir, async_loading_frames=False
+        video_path=video_dir,
+        async_loading_frames=False,
+        num_loading_workers=num_loading_workers,
+        feature_store_dir=feature_store_dir,
+        maskmem_storage_dtype=maskmem_storage_dtype,
+        pred_masks_storage_dtype=pred_masks_storage_dtype,
     )
-    height = inference_state["video_height"]
-    width = inference_state["video_width"]
     input_palette = None
 
     # fetch mask inputs from input_mask_dir (either only mask for the first frame, or all available masks)
@@ -174,9 +177,62 @@ def vos_inference(
                 mask=object_mask,
             )
 
-    # run propagation throughout the video and collect the results in a dict
+    return inference_state, frame_names, input_palette
+
+
+def save_video_segments(
+    output_mask_dir,
+    video_name,
+    frame_names,
+    video_segments,
+    height,
+    width,
+    per_obj_png_file,
+    output_palette,
+):
+    """Save the per-frame segmentation results of a video to a directory."""
     os.makedirs(os.path.join(output_mask_dir, video_name), exist_ok=True)
-    output_palette = input_palette or DAVIS_PALETTE
+    # write the output masks as palette PNG files to output_mask_dir
+    for out_frame_idx, per_obj_output_mask in video_segments.items():
+        save_masks_to_dir(
+            output_mask_dir=output_mask_dir,
+            video_name=video_name,
+            frame_name=frame_names[out_frame_idx],
+            per_obj_output_mask=per_obj_output_mask,
+            height=height,
+            width=width,
+            per_obj_png_file=per_obj_png_file,
+            output_palette=output_palette,
+        )
+
+
+@torch.inference_mode()
+@torch.autocast(device_type="cuda", dtype=torch.bfloat16)
+def vos_inference(
+    predictor,
+    base_video_dir,
+    input_mask_dir,
+    output_mask_dir,
+    video_name,
+    score_thresh=0.0,
+    use_all_masks=False,
+    per_obj_png_file=False,
+    num_loading_workers=0,
+    feature_store_dir=None,
+):
+    """Run VOS inference on a single video with the given predictor."""
+    inference_state, frame_names, input_palette = init_video_state(
+        predictor=predictor,
+        base_video_dir=base_video_dir,
+        input_mask_dir=input_mask_dir,
+        video_name=video_name,
+        use_all_masks=use_all_masks,
+        per_obj_png_file=per_obj_png_file,
+        num_loading_workers=num_loading_workers,
+        feature_store_dir=feature_store_dir,
+    )
+
+    # run propagation throughout the video and collect the results in a dict
     video_segments = {}  # video_segments contains the per-frame segmentation results
     for out_frame_idx, out_obj_ids, out_mask_logits in predictor.propagate_in_video(
         inference_state
@@ -187,17 +243,73 @@ def vos_inference(
         }
         video_segments[out_frame_idx] = per_obj_output_mask
 
-    # write the output masks as palette PNG files to output_mask_dir
-    for out_frame_idx, per_obj_output_mask in video_segments.items():
-        save_masks_to_dir(
+    save_video_segments(
+        output_mask_dir=output_mask_dir,
+        video_name=video_name,
+        frame_names=frame_names,
+        video_segments=video_segments,
+        height=inference_state["video_height"],
+        width=inference_state["video_width"],
+        per_obj_png_file=per_obj_png_file,
+        output_palette=input_palette or DAVIS_PALETTE,
+    )
+
+
+@torch.inference_mode()
+@torch.autocast(device_type="cuda", dtype=torch.bfloat16)
+def vos_inference_multi(
+    predictor,
+    base_video_dir,
+    input_mask_dir,
+    output_mask_dir,
+    video_names,
+    score_thresh=0.0,
+    use_all_masks=False,
+    per_obj_png_file=False,
+    num_loading_workers=0,
+    feature_store_dir=None,
+):
+    """
+    Run VOS inference on several videos together with the given predictor, tracking
+    them in batched forward passes via `propagate_in_videos`.
+    """
+    videos = [
+        init_video_state(
+            predictor=predictor,
+            base_video_dir=base_video_dir,
+            input_mask_dir=input_mask_dir,
+            video_name=video_name,
+            use_all_masks=use_all_masks,
+            per_obj_png_file=per_obj_png_file,
+            num_loading_workers=num_loading_workers,
+            feature_store_dir=feature_store_dir,
+        )
+        for video_name in video_names
+    ]
+    inference_states = [inference_state for inference_state, _, _ in videos]
+
+    # run propagation throughout all videos and collect the results in dicts
+    video_segments = [{} for _ in video_names]
+    outputs = predictor.propagate_in_videos(inference_states)
+    for video_idx, out_frame_idx, out_obj_ids, out_mask_logits in outputs:
+        per_obj_output_mask = {
+            out_obj_id: (out_mask_logits[i] > score_thresh).cpu().numpy()
+            for i, out_obj_id in enumerate(out_obj_ids)
+        }
+        video_segments[video_idx][out_frame_idx] = per_obj_output_mask
+
+    for video_name, (inference_state, frame_names, input_palette), segments in zip(
+        video_names, videos, video_segments
+    ):
+        save_video_segments(
             output_mask_dir=output_mask_dir,
             video_name=video_name,
-            frame_name=frame_names[out_frame_idx],
-            per_obj_output_mask=per_obj_output_mask,
-            height=height,
-            width=width,
+            frame_names=frame_names,
+            video_segments=segments,
+            height=inference_state["video_height"],
+            width=inference_state["video_width"],
             per_obj_png_file=per_obj_png_file,
-            output_palette=output_palette,
+            output_palette=input_palette or DAVIS_PALETTE,
         )
 
 
@@ -265,6 +377,27 @@ def main():
         help="whether to apply postprocessing (e.g. hole-filling) to the output masks "
         "(we don't apply such post-processing in the SAM 2 model evaluation)",
     )
+    parser.add_argument(
+        "--num_loading_workers",
+        type=int,
+        default=0,
+        help="number of threads to decode and resize the video frames with "
+        "(default 0 to load them serially)",
+    )
+    parser.add_argument(
+        "--feature_store_dir",
+        type=str,
+        default=None,
+        help="directory of the on-disk image feature stores, which are filled on the "
+        "first run over each video and reused by later runs to skip the image encoder",
+    )
+    parser.add_argument(
+        "--num_videos_per_batch",
+        type=int,
+        default=1,
+        help="number of videos to track together in batched forward passes, which "
+        "makes better use of the GPU on videos with few objects (default: 1)",
+    )
     args = parser.parse_args()
 
     # if we use per-object PNG files, they could possibly overlap in inputs and outputs
@@ -297,18 +430,41 @@ def main():
         ]
     print(f"running VOS prediction on {len(video_names)} videos:\n{video_names}")
 
-    for n_video, video_name in enumerate(video_names):
-        print(f"\n{n_video + 1}/{len(video_names)} - running on {video_name}")
-        vos_inference(
-            predictor=predictor,
-            base_video_dir=args.base_video_dir,
-            input_mask_dir=args.input_mask_dir,
-            output_mask_dir=args.output_mask_dir,
-            video_name=video_name,
-            score_thresh=args.score_thresh,
-            use_all_masks=args.use_all_masks,
-            per_obj_png_file=args.per_obj_png_file,
-        )
+    if args.num_videos_per_batch > 1:
+        batch_size = args.num_videos_per_batch
+        for n_video in range(0, len(video_names), batch_size):
+            batch_video_names = video_names[n_video : n_video + batch_size]
+            print(
+                f"\n{n_video + len(batch_video_names)}/{len(video_names)} - "
+                f"running on {batch_video_names}"
+            )
+            vos_inference_multi(
+                predictor=predictor,
+                base_video_dir=args.base_video_dir,
+                input_mask_dir=args.input_mask_dir,
+                output_mask_dir=args.output_mask_dir,
+                video_names=batch_video_names,
+                score_thresh=args.score_thresh,
+                use_all_masks=args.use_all_masks,
+                per_obj_png_file=args.per_obj_png_file,
+                num_loading_workers=args.num_loading_workers,
+                feature_store_dir=args.feature_store_dir,
+            )
+    else:
+        for n_video, video_name in enumerate(video_names):
+            print(f"\n{n_video + 1}/{len(video_names)} - running on {video_name}")
+            vos_inference(
+                predictor=predictor,
+                base_video_dir=args.base_video_dir,
+                input_mask_dir=args.input_mask_dir,
+                output_mask_dir=args.output_mask_dir,
+                video_name=video_name,
+                score_thresh=args.score_thresh,
+                use_all_masks=args.use_all_masks,
+                per_obj_png_file=args.per_obj_png_file,
+                num_loading_workers=args.num_loading_workers,
+                feature_store_dir=args.feature_store_dir,
+            )
 
     print(
         f"completed VOS prediction on {len(video_names)} videos -- "